@@ -0,0 +1,120 @@
+"""
+Per-request overhead of the middleware stack.
+
+Compares a bare app, the previous @app.middleware('http') functions and
+the pure ASGI middleware from src.middleware, all served in-process
+through httpx's ASGI transport:
+
+    python benchmarks/middleware_overhead.py [requests]
+"""
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# src.config needs these, the benchmark never connects to anything
+for name, value in (('DATABASE_URL', 'postgresql+asyncpg://bench@localhost/bench'),
+                    ('JWT_SECRET_KEY', 'bench'),
+                    ('JWT_ALGORITHM', 'HS256'),
+                    ('REDIS_URL', 'redis://localhost')):
+    os.environ.setdefault(name, value)
+
+import httpx
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
+from src.access_log import access_log
+from src.middleware import AccessLogMiddleware, AuthorizationHeaderMiddleware
+
+HEADERS = {'Authorization': 'Bearer bench'}
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/ping')
+    async def ping() -> dict:
+        return {'ok': True}
+
+    return app
+
+
+def base_http_app() -> FastAPI:
+    # the functions register_middleware used to add, with call_next fixed
+    app = create_app()
+
+    @app.middleware('http')
+    async def custom_logging(request: Request, call_next):
+        start_time = time.time()
+        response = await call_next(request)
+        end_time = time.time() - start_time
+
+        message = f"{request.client.host}:{request.client.port} - {request.method} - {request.url.path} - {response.status_code} completed after {end_time}s"
+        print(message)
+        return response
+
+    @app.middleware('http')
+    async def check_authorization_header(request: Request, call_next):
+        if not 'Authorization' in request.headers:
+            return JSONResponse(
+                content={'message': 'Not Authenticated'},
+                status_code=status.HTTP_401_UNAUTHORIZED
+            )
+
+        return await call_next(request)
+
+    return app
+
+
+def pure_asgi_app() -> FastAPI:
+    app = create_app()
+    app.add_middleware(AuthorizationHeaderMiddleware,
+                       exempt_prefixes=['/docs'])
+    app.add_middleware(AccessLogMiddleware)
+    return app
+
+
+async def measure(app: FastAPI, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport,
+                                 base_url='http://localhost') as client:
+        for _ in range(min(requests // 10, 500)):
+            await client.get('/ping', headers=HEADERS)
+
+        started_at = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get('/ping', headers=HEADERS)
+            assert response.status_code == 200
+        return (time.perf_counter() - started_at) / requests
+
+
+async def main(requests: int) -> None:
+    results = {}
+
+    # the json access log is written by its thread, to nowhere
+    for handler in access_log.listener.handlers:
+        handler.setStream(open(os.devnull, 'w'))
+    access_log.start()
+
+    # the access log prints every request, keep it out of the report
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, factory in (('bare app', create_app),
+                              ("@app.middleware('http')", base_http_app),
+                              ('pure ASGI', pure_asgi_app)):
+            results[name] = await measure(factory(), requests)
+
+    access_log.stop()
+
+    baseline = results['bare app']
+    print(f'{requests} requests each')
+    for name, per_request in results.items():
+        print(f'{name:<26} {per_request * 1e6:8.1f} us/request'
+              f'   overhead {(per_request - baseline) * 1e6:7.1f} us')
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,95 @@
+"""
+Cost of turning a page of books into a JSON body.
+
+Compares schema_response from src.responses with pydantic validating the
+ORM rows and dumping them, with and without FastAPI's own encoding pass
+that a response_model route adds on top:
+
+    python benchmarks/serialization.py [books] [rounds]
+"""
+import os
+import sys
+import time
+import uuid
+from datetime import date, datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# src.config needs these, the benchmark never connects to anything
+for name, value in (('DATABASE_URL', 'postgresql+asyncpg://bench@localhost/bench'),
+                    ('JWT_SECRET_KEY', 'bench'),
+                    ('JWT_ALGORITHM', 'HS256'),
+                    ('REDIS_URL', 'redis://localhost')):
+    os.environ.setdefault(name, value)
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from src.books.schemas import BookPageSchema
+from src.db.models import Book
+from src.responses import schema_response
+
+
+def make_books(count: int) -> list:
+    now = datetime.now(timezone.utc)
+
+    return [
+        Book(
+            uid=uuid.uuid4(),
+            title=f'Book {index}',
+            author='Some Author',
+            publisher='Some Publisher',
+            published_date=date(2020, 1, 1),
+            page_count=300,
+            language='en',
+            review_count=3,
+            rating_sum=12,
+            rating_histogram={'3': 1, '4': 1, '5': 1},
+            user_uid=uuid.uuid4(),
+            created_at=now,
+            updated_at=now
+        )
+        for index in range(count)
+    ]
+
+
+def fast_path(page: dict) -> bytes:
+    return schema_response(BookPageSchema, page).body
+
+
+page_adapter = TypeAdapter(BookPageSchema)
+
+
+def pydantic_dump(page: dict) -> bytes:
+    return page_adapter.dump_json(
+        page_adapter.validate_python(page, from_attributes=True))
+
+
+def response_model_path(page: dict) -> bytes:
+    # what FastAPI does for a response_model: validate, encode, render
+    validated = page_adapter.validate_python(page, from_attributes=True)
+    return JSONResponse(jsonable_encoder(validated)).body
+
+
+def measure(serialize, page: dict, rounds: int) -> float:
+    serialize(page)
+
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        serialize(page)
+    return (time.perf_counter() - started_at) / rounds
+
+
+def main(books: int, rounds: int) -> None:
+    page = {'books': make_books(books), 'next_cursor': None}
+
+    print(f'{books} books, {rounds} rounds each')
+    for name, serialize in (('schema_response', fast_path),
+                            ('validate + dump_json', pydantic_dump),
+                            ('response_model', response_model_path)):
+        print(f'{name:<22} {measure(serialize, page, rounds) * 1000:8.2f} ms/page')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 50)
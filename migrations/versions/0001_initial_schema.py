@@ -0,0 +1,75 @@
+"""initial schema
+
+The tables exactly as init_db used to create them, without any index
+added since. Databases that were created that way should be stamped with
+this revision instead of upgraded, every later index is built
+concurrently by its own revision.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('username', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('first_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('last_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('role', postgresql.VARCHAR(), server_default='user', nullable=False),
+        sa.Column('is_verified', sa.Boolean(), nullable=False),
+        sa.Column('password_hash', postgresql.VARCHAR(), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('uid')
+    )
+    op.create_table(
+        'books',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('title', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('author', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('publisher', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('published_date', sa.Date(), nullable=False),
+        sa.Column('page_count', sa.Integer(), nullable=False),
+        sa.Column('language', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('user_uid', sa.Uuid(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_uid'], ['users.uid']),
+        sa.PrimaryKeyConstraint('uid')
+    )
+    op.create_table(
+        'reviews',
+        sa.Column('uid', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('rating', sa.Integer(), nullable=False),
+        sa.Column('review_text', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('user_uid', sa.Uuid(), nullable=True),
+        sa.Column('book_uid', sa.Uuid(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('updated_at', postgresql.TIMESTAMP(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['book_uid'], ['books.uid']),
+        sa.ForeignKeyConstraint(['user_uid'], ['users.uid']),
+        sa.PrimaryKeyConstraint('uid')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('reviews')
+    op.drop_table('books')
+    op.drop_table('users')
@@ -0,0 +1,45 @@
+"""books full-text search vector
+
+Adds a generated tsvector over title, author and publisher with a GIN
+index, built concurrently so the books table stays writable.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # the column is generated by postgres, so it never drifts from the row
+    op.execute("""
+        ALTER TABLE books ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(publisher, '')), 'C')
+        ) STORED
+    """)
+
+    # concurrent index builds cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        op.execute(
+            'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_books_search_vector '
+            'ON books USING gin (search_vector)'
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_books_search_vector')
+
+    op.execute('ALTER TABLE books DROP COLUMN search_vector')
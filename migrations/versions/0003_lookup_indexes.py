@@ -0,0 +1,51 @@
+"""lookup indexes
+
+Indexes for the columns the hot queries filter on. The keyset pagination
+indexes on books also serve plain lookups by user_uid and created_at
+through their leading columns.
+
+The unique index on users.email fails to build while duplicate emails
+exist, they have to be merged first.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = [
+    ('ix_books_created_at_uid', 'books', ['created_at', 'uid'], False),
+    ('ix_books_user_uid_created_at_uid', 'books',
+     ['user_uid', 'created_at', 'uid'], False),
+    ('ix_users_email', 'users', ['email'], True),
+    ('ix_reviews_book_uid', 'reviews', ['book_uid'], False),
+    ('ix_reviews_user_uid', 'reviews', ['user_uid'], False),
+    ('ix_reviews_created_at', 'reviews', ['created_at'], False),
+]
+
+
+def upgrade() -> None:
+    # concurrent builds keep the tables writable but cannot run inside a
+    # transaction, a failed build leaves an invalid index that is dropped
+    # before retrying
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+            op.create_index(name, table, columns, unique=unique,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table,
+                          postgresql_concurrently=True)
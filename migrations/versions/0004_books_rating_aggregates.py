@@ -0,0 +1,59 @@
+"""books rating aggregates
+
+Adds review_count, rating_sum and rating_histogram to books and fills
+them from the existing reviews. `python -m src.books.ratings` runs the
+same recount whenever the aggregates need repairing.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # constant defaults, so adding the columns does not rewrite the table
+    op.add_column('books', sa.Column('review_count', postgresql.INTEGER(),
+                                     server_default='0', nullable=False))
+    op.add_column('books', sa.Column('rating_sum', postgresql.INTEGER(),
+                                     server_default='0', nullable=False))
+    op.add_column('books', sa.Column('rating_histogram', postgresql.JSONB(),
+                                     server_default='{}', nullable=False))
+
+    op.execute("""
+        UPDATE books SET
+            review_count = per_book.review_count,
+            rating_sum = per_book.rating_sum,
+            rating_histogram = per_book.rating_histogram
+        FROM (
+            SELECT book_uid,
+                   sum(reviews) AS review_count,
+                   sum(rating * reviews) AS rating_sum,
+                   jsonb_object_agg(rating, reviews) AS rating_histogram
+            FROM (
+                SELECT book_uid, rating, count(*) AS reviews
+                FROM reviews
+                WHERE book_uid IS NOT NULL
+                GROUP BY book_uid, rating
+            ) AS per_rating
+            GROUP BY book_uid
+        ) AS per_book
+        WHERE books.uid = per_book.book_uid
+    """)
+
+
+def downgrade() -> None:
+    op.drop_column('books', 'rating_histogram')
+    op.drop_column('books', 'rating_sum')
+    op.drop_column('books', 'review_count')
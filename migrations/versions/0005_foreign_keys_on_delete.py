@@ -0,0 +1,53 @@
+"""foreign keys on delete set null
+
+Deletes of books and users are single statements now, postgres clears
+the references to them instead of the ORM loading and updating every
+child row first.
+
+The constraints are added NOT VALID and validated afterwards, so the
+existing rows are checked without blocking writes to the tables.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# constraint names as postgres generated them for 0001
+FOREIGN_KEYS = [
+    ('books_user_uid_fkey', 'books', 'user_uid', 'users'),
+    ('reviews_user_uid_fkey', 'reviews', 'user_uid', 'users'),
+    ('reviews_book_uid_fkey', 'reviews', 'book_uid', 'books'),
+]
+
+
+def replace_foreign_keys(on_delete: str) -> None:
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE {table} DROP CONSTRAINT {name}')
+        op.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) '
+            f'REFERENCES {referred} (uid) {on_delete} NOT VALID'
+        )
+
+    # validation runs after the swap is committed and only takes a lock
+    # that lets writes through
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE {table} VALIDATE CONSTRAINT {name}')
+
+
+def upgrade() -> None:
+    replace_foreign_keys('ON DELETE SET NULL')
+
+
+def downgrade() -> None:
+    replace_foreign_keys('')
@@ -2,8 +2,16 @@ from fastapi import FastAPI
 from src.books.routes import book_router
 from src.auth.routes import auth_router
 from src.reviews.routes import review_router
+from src.stats.routes import stats_router, metrics_router
 from contextlib import asynccontextmanager
 from src.db.main import init_db
+from src.responses import TimedORJSONResponse
+from src.db.redis import sync_blocklist_filter
+from src.auth.utils import password_hasher
+from src.config import Config
+from src.access_log import access_log
+from src.metrics import flush_metrics, registry, snapshot_store
+import asyncio
 from src.errors import register_all_exceptions
 from src.middleware import register_middleware
 
@@ -12,11 +20,26 @@ from src.middleware import register_middleware
 @asynccontextmanager
 async def init_app(app: FastAPI):
     print("Server is starting...")
+    # write the access log from a background thread
+    access_log.start()
     # initialize the database
     await init_db()
+    # keep the local filter of revoked tokens in sync with redis
+    if Config.JTI_FILTER_ENABLED:
+        blocklist_sync = asyncio.create_task(sync_blocklist_filter())
+    # share this worker's metrics with the others
+    if Config.METRICS_ENABLED:
+        metrics_flush = asyncio.create_task(flush_metrics())
     # yield the app
     yield
+    if Config.JTI_FILTER_ENABLED:
+        blocklist_sync.cancel()
+    if Config.METRICS_ENABLED:
+        metrics_flush.cancel()
+        snapshot_store.write(registry.snapshot())
+    password_hasher.shutdown()
     print("Server has been stopped...")
+    access_log.stop()
 
 
 version = 'v1'
@@ -25,7 +48,9 @@ version = 'v1'
 app = FastAPI(
     version=version,
     title='Bookly',
-    description='A REST API for book review web service'
+    description='A REST API for book review web service',
+    lifespan=init_app,
+    default_response_class=TimedORJSONResponse
 )
 
 # register all exceptions
@@ -51,3 +76,11 @@ app.include_router(
     prefix=f'/api/{version}/reviews',
     tags=['Reviews']
 )
+app.include_router(
+    stats_router,
+    prefix=f'/api/{version}/stats',
+    tags=['Stats']
+)
+
+if Config.METRICS_ENABLED:
+    app.include_router(metrics_router, tags=['Stats'])
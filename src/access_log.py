@@ -0,0 +1,120 @@
+import logging
+import queue
+import random
+import sys
+import orjson
+from logging.handlers import QueueHandler, QueueListener
+from starlette.types import Scope
+from src.config import Config
+
+ACCESS_LOGGER_NAME = 'bookly.access'
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Renders the access record carried by a log record as one JSON line.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        return orjson.dumps({
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S%z'),
+            **record.access
+        }).decode()
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread as they are, so formatting and
+    writing never run on the event loop, and drops them when the queue is
+    full instead of blocking.
+    """
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AccessLog:
+    """
+    Structured access log written by a background thread.
+
+    Successful requests are sampled, errors and slow requests are always
+    logged.
+    """
+
+    def __init__(self, sample_rate: float, slow_ms: int, queue_size: int) -> None:
+        self.sample_rate = sample_rate
+        self.slow_ns = slow_ms * 1_000_000
+        self.handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+
+        self.logger = logging.getLogger(ACCESS_LOGGER_NAME)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.handler.queue, stream_handler)
+        self.running = False
+
+    def start(self) -> None:
+        if not self.running:
+            self.listener.start()
+            self.running = True
+
+    def stop(self) -> None:
+        # flushes whatever is still queued
+        if self.running:
+            self.listener.stop()
+            self.running = False
+
+    def record(self, scope: Scope, status_code: int, duration_ns: int) -> None:
+        slow = duration_ns >= self.slow_ns
+
+        # redirects and 304s are as routine as 2xx, they are sampled alike
+        if (status_code < 400 and not slow
+                and random.random() >= self.sample_rate):
+            return
+
+        host, port = scope.get('client') or (None, None)
+        access = {
+            'client': f'{host}:{port}' if host else None,
+            'method': scope['method'],
+            'path': scope['path'],
+            'status': status_code,
+            'duration_ms': duration_ns / 1_000_000,
+        }
+
+        if status_code < 400 and not slow:
+            access['sample_rate'] = self.sample_rate
+        if slow:
+            access['slow'] = True
+
+        record = self.logger.makeRecord(
+            ACCESS_LOGGER_NAME, logging.INFO, __file__, 0,
+            'access', None, None, extra={'access': access})
+        self.handler.handle(record)
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'queued': self.handler.queue.qsize(),
+            'dropped': self.handler.dropped
+        }
+
+
+# create the shared access log
+access_log = AccessLog(
+    sample_rate=Config.ACCESS_LOG_SAMPLE_RATE,
+    slow_ms=Config.ACCESS_LOG_SLOW_MS,
+    queue_size=Config.ACCESS_LOG_QUEUE_SIZE
+)
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from src.cache import LRUCache
+from src.config import Config
+from src.db.models import User
+from src.db.redis import (
+    get_cached_value,
+    set_cached_value,
+    delete_cached_value,
+    reset_role_version
+)
+
+PRINCIPAL_KEY_PREFIX = 'principal:'
+
+# keep references to fire-and-forget tasks until they finish
+_pending_tasks = set()
+
+
+def _schedule(coro) -> None:
+    task = asyncio.get_running_loop().create_task(coro)
+    _pending_tasks.add(task)
+    task.add_done_callback(_pending_tasks.discard)
+
+
+class PrincipalCache:
+    """
+    Caches the user resolved from an access token, keyed by user_uid.
+
+    The first tier is an in-process LRU, the optional second tier is
+    shared through redis. Cached principals are read-only snapshots that
+    are detached from any session and never carry the password hash.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, use_redis: bool) -> None:
+        self.ttl = ttl
+        self.use_redis = use_redis
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, user_uid: str) -> Optional[User]:
+        principal = self.local.get(user_uid)
+
+        if principal is None and self.use_redis:
+            try:
+                data = await get_cached_value(PRINCIPAL_KEY_PREFIX + user_uid)
+            except Exception as e:
+                logging.exception(e)
+                data = None
+
+            if data:
+                principal = self._to_principal(json.loads(data))
+                self.local.set(user_uid, principal)
+                self.redis_hits += 1
+
+        if principal is None:
+            self.misses += 1
+
+        return principal
+
+    async def set(self, user: User) -> User:
+        user_uid = str(user.uid)
+        data = user.model_dump(mode='json')
+
+        if self.use_redis:
+            try:
+                await set_cached_value(
+                    PRINCIPAL_KEY_PREFIX + user_uid,
+                    json.dumps(data),
+                    self.ttl
+                )
+            except Exception as e:
+                logging.exception(e)
+
+        principal = self._to_principal(data)
+        self.local.set(user_uid, principal)
+        return principal
+
+    async def invalidate(self, user_uid: str) -> None:
+        self.local.delete(user_uid)
+
+        if self.use_redis:
+            await delete_cached_value(PRINCIPAL_KEY_PREFIX + user_uid)
+
+    def invalidate_soon(self, user_uid: str) -> None:
+        # used from synchronous session events, the redis delete is scheduled
+        self.local.delete(user_uid)
+
+        if self.use_redis:
+            _schedule(delete_cached_value(PRINCIPAL_KEY_PREFIX + user_uid))
+
+    def stats(self) -> dict:
+        return {
+            'local': self.local.stats(),
+            'redis_enabled': self.use_redis,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses
+        }
+
+    def _to_principal(self, data: dict) -> User:
+        principal = User.model_validate({**data, 'password_hash': ''})
+        make_transient_to_detached(principal)
+        return principal
+
+
+# create the shared principal cache
+principal_cache = PrincipalCache(
+    maxsize=Config.PRINCIPAL_CACHE_SIZE,
+    ttl=Config.PRINCIPAL_CACHE_TTL,
+    use_redis=Config.PRINCIPAL_CACHE_REDIS
+)
+
+
+# invalidate cached principals whenever a user row is written, and reset
+# the role version so role claims in issued tokens stop being trusted
+@event.listens_for(Session, 'after_flush')
+def collect_written_users(session: Session, flush_context) -> None:
+    written = session.info.setdefault('written_user_uids', set())
+    role_changed = session.info.setdefault('role_changed_user_uids', set())
+
+    for instance in list(session.dirty) + list(session.deleted):
+        if isinstance(instance, User):
+            written.add(str(instance.uid))
+
+            if (instance in session.deleted
+                    or inspect(instance).attrs.role.history.has_changes()):
+                role_changed.add(str(instance.uid))
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_written_users(session: Session) -> None:
+    for user_uid in session.info.pop('written_user_uids', ()):
+        principal_cache.invalidate_soon(user_uid)
+
+    for user_uid in session.info.pop('role_changed_user_uids', ()):
+        _schedule(reset_role_version(user_uid))
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_written_users(session: Session) -> None:
+    session.info.pop('written_user_uids', None)
+    session.info.pop('role_changed_user_uids', None)
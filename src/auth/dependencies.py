@@ -3,12 +3,19 @@ from fastapi.security.http import HTTPAuthorizationCredentials
 from src.auth.utils import decode_access_token
 from fastapi.exceptions import HTTPException
 from fastapi import status, Request, Depends
-from src.db.redis import check_jti_in_blocklist
+from src.db.redis import check_jti_in_blocklist, get_role_version
 from src.db.main import get_session
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.auth.service import UserService
+from src.auth.cache import principal_cache
+from src.cache import LRUCache
 from typing import List, Any
 from src.db.models import User
+from src.config import Config
+from src.timing import timed
+import hashlib
+import logging
+import time
 from src.errors import (
     InvalidToken,
     RefreshTokenRequired,
@@ -19,6 +26,45 @@ from src.errors import (
 # create an instance of the user service
 user_service = UserService()
 
+# decoded tokens keyed by their digest, an entry never outlives its token
+verified_token_cache = LRUCache(
+    maxsize=Config.VERIFIED_TOKEN_CACHE_SIZE,
+    ttl=0
+)
+
+
+def verify_token(token: str) -> dict:
+    digest = hashlib.sha256(token.encode()).digest()
+    token_data = verified_token_cache.get(digest)
+
+    if token_data is None:
+        token_data = decode_access_token(token)
+
+        if token_data is None:
+            raise InvalidToken()
+
+        verified_token_cache.set(
+            digest, token_data, ttl=token_data['exp'] - time.time())
+
+    return token_data
+
+
+async def resolve_token(request: Request, token: str) -> dict:
+    # the auth context is shared by every bearer instance in one request,
+    # so the token is verified and checked against the blocklist only once
+    token_data = getattr(request.state, 'token_data', None)
+
+    if token_data is None:
+        with timed('auth'):
+            token_data = verify_token(token)
+
+            if await check_jti_in_blocklist(token_data['jti']):
+                raise InvalidToken()
+
+        request.state.token_data = token_data
+
+    return token_data
+
 
 class TokenBearer(HTTPBearer):
 
@@ -27,23 +73,12 @@ class TokenBearer(HTTPBearer):
 
     async def __call__(self, request: Request) -> HTTPAuthorizationCredentials | None:
         creds = await super().__call__(request)
-        token = creds.credentials
-        token_data = decode_access_token(token)
-
-        if not self.token_valid(token):
-            raise InvalidToken()
-
-        if await check_jti_in_blocklist(token_data['jti']):
-            raise InvalidToken()
+        token_data = await resolve_token(request, creds.credentials)
 
         self.verify_token_data(token_data)
 
         return token_data
 
-    def token_valid(self, token: str) -> bool:
-        token_data = decode_access_token(token)
-        return token_data is not None
-
     def verify_token_data(self, token_data):
         raise NotImplementedError(
             "Please Override this method in child classes")
@@ -69,17 +104,60 @@ async def get_current_user(
     token_details: dict = Depends(access_token_bearer),
     session: AsyncSession = Depends(get_session)
 ):
-    user_email = token_details['user']['email']
-    user = await user_service.get_user_by_email(user_email, session)
+    user_uid = token_details['user']['user_uid']
+    user = await principal_cache.get(user_uid)
+
+    if user is None:
+        user = await user_service.get_user_by_uid(user_uid, session)
+
+        if user is None:
+            raise InvalidToken()
+
+        user = await principal_cache.set(user)
+
     return user
 
 
+async def get_claimed_role(token_details: dict) -> str | None:
+    # the role claim is trusted while its version matches the one in redis,
+    # bumping the version forces the next request back to the database
+    user_data = token_details['user']
+
+    if 'role' not in user_data:
+        return None
+
+    try:
+        role_version = await get_role_version(user_data['user_uid'])
+    except Exception as e:
+        logging.exception(e)
+        return None
+
+    if role_version is None or user_data.get('role_version') != role_version:
+        return None
+
+    return user_data['role']
+
+
 class RoleChecker:
     def __init__(self, allowed_roles: List[str]) -> None:
         self.allowed_roles = allowed_roles
 
-    def __call__(self, current_user=Depends(get_current_user)) -> Any:
-        if current_user.role in self.allowed_roles:
+    async def __call__(
+        self,
+        token_details: dict = Depends(access_token_bearer),
+        session: AsyncSession = Depends(get_session)
+    ) -> Any:
+        role = None
+
+        if Config.ROLE_CLAIMS_AUTHORIZATION:
+            with timed('auth'):
+                role = await get_claimed_role(token_details)
+
+        if role is None:
+            current_user = await get_current_user(token_details, session)
+            role = current_user.role
+
+        if role in self.allowed_roles:
             return True
 
-        raise InsufficientPermissions()
\ No newline at end of file
+        raise InsufficientPermissions()
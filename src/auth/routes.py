@@ -1,3 +1,4 @@
+import logging
 from fastapi import APIRouter, Depends, status
 from fastapi.exceptions import HTTPException
 from src.auth.schemas import (
@@ -7,13 +8,14 @@ from src.auth.schemas import (
     UserBookViewSchema
 )
 from src.auth.service import UserService
-from src.db.main import get_session
+from src.db.main import get_session, get_read_session
 from sqlalchemy.ext.asyncio.session import AsyncSession
 from src.auth.utils import (
     create_access_token,
     verify_password_hash
 )
 from datetime import timedelta, datetime
+from redis.exceptions import RedisError
 from fastapi.responses import JSONResponse
 from src.auth.dependencies import (
     RefreshTokenBearer,
@@ -21,7 +23,7 @@ from src.auth.dependencies import (
     get_current_user,
     RoleChecker
 )
-from src.db.redis import add_jti_to_blocklist
+from src.db.redis import add_jti_to_blocklist, ensure_role_version
 from src.errors import (
     InvalidToken,
     InvalidCredentials,
@@ -51,14 +53,11 @@ async def create_user_account(
     user_data: UserCreateSchema,
     session: AsyncSession = Depends(get_session)
 ) -> UserViewSchema:
-    email = user_data.email
-
-    is_user_exists = await user_service.check_user_exists(email, session)
+    user = await user_service.create_user(user_data, session)
 
-    if is_user_exists:
+    if user is None:
         raise UserAlreadyExists()
 
-    user = await user_service.create_user(user_data, session)
     return user
 
 
@@ -73,24 +72,35 @@ async def login(
     user = await user_service.get_user_by_email(email, session)
 
     if user:
-        valid_password = verify_password_hash(
+        valid_password = await verify_password_hash(
             password,
             user.password_hash
         )
 
         if valid_password:
+            # the role claim is checked against this version on every request,
+            # without one the token is always authorized from the database
+            try:
+                role_version = await ensure_role_version(str(user.uid))
+            except (RedisError, OSError) as e:
+                logging.warning(f"Role version unavailable at login: {e!r}")
+                role_version = None
+
             access_token = create_access_token(
                 user_data={
                     'email': user.email,
                     'user_uid': str(user.uid),
-                    'role': user.role
+                    'role': user.role,
+                    'role_version': role_version
                 }
             )
 
             refresh_token = create_access_token(
                 user_data={
                     'email': user.email,
-                    'user_uid': str(user.uid)
+                    'user_uid': str(user.uid),
+                    'role': user.role,
+                    'role_version': role_version
                 },
                 refresh=True,
                 expiry=timedelta(days=REFRESH_TOKEN_EXPIRY)
@@ -149,6 +159,8 @@ async def logout(
 @auth_router.get('/me', response_model=UserBookViewSchema)
 async def get_current_user_details(
     current_user: UserViewSchema = Depends(get_current_user),
-    _: bool = Depends(role_checker)
+    _: bool = Depends(role_checker),
+    session: AsyncSession = Depends(get_read_session)
 ) -> UserBookViewSchema:
-    return current_user
+    user = await user_service.get_user_details(current_user.email, session)
+    return user
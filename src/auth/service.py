@@ -1,31 +1,67 @@
 from sqlmodel import select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.db.models import User
+from src.db.loader import get_loader, load_one
 from src.auth.schemas import UserCreateSchema
 from src.auth.utils import generate_password_hash
 
 
 class UserService:
     async def get_user_by_email(self, email: str, session: AsyncSession):
-        statement = select(User).where(User.email == email)
+        # batched and cached for the request, a user found by email is also
+        # known by uid and the other way around
+        user = await load_one(session, User, User.email, email)
+
+        if user:
+            get_loader(session, User, User.uid).prime(user.uid, user)
+
+        return user
+
+    async def get_user_by_uid(self, user_uid: str, session: AsyncSession):
+        user = await load_one(session, User, User.uid, user_uid)
+
+        if user:
+            get_loader(session, User, User.email).prime(user.email, user)
+
+        return user
+
+    async def get_user_details(self, email: str, session: AsyncSession):
+        # the profile view is the only place that needs books and reviews
+        statement = select(User).where(User.email == email).options(
+            selectinload(User.books),
+            selectinload(User.reviews)
+        )
         result = await session.exec(statement)
         user = result.first()
         return user
 
-    async def check_user_exists(self, email: str, session: AsyncSession):
-        user = await self.get_user_by_email(email, session)
-        return True if user else False
-
     async def create_user(self,
                           user_data: UserCreateSchema,
                           session: AsyncSession):
         user_data_dict = user_data.model_dump()
-        user = User(**user_data_dict)
 
-        password = generate_password_hash(user_data_dict['password'])
-        user.password_hash = password
-        user.role = 'user'
+        # hashed before the first statement, the transaction only lasts
+        # for the insert and its commit
+        password_hash = await generate_password_hash(
+            user_data_dict.pop('password'))
+
+        # the unique email index decides between concurrent signups, a
+        # conflict inserts nothing and returns no row
+        statement = insert(User).values(
+            **user_data_dict,
+            password_hash=password_hash,
+            role='user'
+        ).on_conflict_do_nothing(
+            index_elements=[User.email]
+        ).returning(User)
+
+        result = await session.execute(statement)
+        user = result.scalars().first()
+
+        if user is None:
+            return None
 
-        session.add(user)
         await session.commit()
         return user
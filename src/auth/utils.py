@@ -1,7 +1,11 @@
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime, timedelta
 from src.config import Config
+from src.errors import ServiceUnavailable
+import asyncio
 import jwt
+import time
 import uuid
 import logging
 
@@ -12,15 +16,97 @@ passwd_context = CryptContext(
 ACCESS_TOKEN_EXPIRY = 3600
 
 
-def generate_password_hash(password: str) -> str:
-    passwd_hash = passwd_context.hash(password)
-    return passwd_hash
+def _hash_password(password: str) -> str:
+    return passwd_context.hash(password)
 
 
-def verify_password_hash(password: str, passwd_hash: str) -> bool:
+def _verify_password(password: str, passwd_hash: str) -> bool:
     return passwd_context.verify(password, passwd_hash)
 
 
+def _run_timed(submitted_at: float, func, *args):
+    # runs in the worker, reports how long the job sat in the queue
+    waited = time.perf_counter() - submitted_at
+    return func(*args), waited
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a bounded worker pool so it never blocks the event loop.
+
+    Once max_pending jobs are queued or running, new jobs are rejected
+    with ServiceUnavailable instead of waiting.
+    """
+
+    def __init__(self, executor: str, workers: int, max_pending: int) -> None:
+        executor_class = (ProcessPoolExecutor if executor == 'process'
+                          else ThreadPoolExecutor)
+        self.executor = executor_class(max_workers=workers)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ServiceUnavailable()
+
+        self.pending += 1
+        loop = asyncio.get_running_loop()
+
+        try:
+            result, waited = await loop.run_in_executor(
+                self.executor, _run_timed, time.perf_counter(), func, *args)
+        finally:
+            self.pending -= 1
+
+        self.completed += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        return result
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.pending - self.workers)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'in_flight': self.pending,
+            'queue_depth': self.queue_depth,
+            'max_pending': self.max_pending,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_time_avg_ms': (self.wait_time_total / self.completed * 1000
+                                 if self.completed else 0.0),
+            'wait_time_max_ms': self.wait_time_max * 1000
+        }
+
+
+# create the shared password hashing pool
+password_hasher = PasswordHasher(
+    executor=Config.PASSWORD_HASH_EXECUTOR,
+    workers=Config.PASSWORD_HASH_WORKERS,
+    max_pending=Config.PASSWORD_HASH_MAX_PENDING
+)
+
+
+async def generate_password_hash(password: str) -> str:
+    passwd_hash = await password_hasher.run(_hash_password, password)
+    return passwd_hash
+
+
+async def verify_password_hash(password: str, passwd_hash: str) -> bool:
+    return await password_hasher.run(_verify_password, password, passwd_hash)
+
+
 def create_access_token(
         user_data: dict,
         expiry: timedelta = None,
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+import uuid
+import orjson
+from datetime import datetime
+from typing import Awaitable, Callable, NamedTuple, Optional
+from fastapi import Response
+from redis.exceptions import RedisError
+from src.books.schemas import BookReviewViewSchema
+from src.conditional import make_etag, cache_headers
+from src.config import Config
+from src.db.redis import redis_client
+from src.responses import dump
+
+BOOK_KEY_PREFIX = 'book:'
+BOOK_LOCK_PREFIX = 'book_lock:'
+LOCK_POLL_SECONDS = 0.02
+
+# the entry is only stored while the lock taken for the load is still held,
+# an invalidation in between deletes the lock and the stale entry is dropped
+STORE_IF_LOCKED = """
+if redis.call('get', KEYS[2]) == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    redis.call('del', KEYS[2])
+    return 1
+end
+return 0
+"""
+
+RELEASE_IF_LOCKED = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class CachedBook(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime]
+    body: bytes
+
+    def encode(self) -> str:
+        last_modified = self.last_modified.isoformat() if self.last_modified else ''
+        return f'{self.etag}\n{last_modified}\n{self.body.decode()}'
+
+    @classmethod
+    def decode(cls, value: str) -> 'CachedBook':
+        etag, last_modified, body = value.split('\n', 2)
+        return cls(
+            etag,
+            datetime.fromisoformat(last_modified) if last_modified else None,
+            body.encode()
+        )
+
+    def response(self) -> Response:
+        return Response(
+            content=self.body,
+            media_type='application/json',
+            headers=cache_headers(self.etag, self.last_modified)
+        )
+
+
+def book_validators(book_uid: str, version) -> tuple:
+    # the etag changes with the book and with any review added, edited or
+    # removed
+    updated_at, review_count, latest_review_at = version
+    etag = make_etag(str(book_uid).lower(), updated_at,
+                     review_count, latest_review_at)
+    last_modified = max(
+        filter(None, (updated_at, latest_review_at)), default=None)
+    return etag, last_modified
+
+
+def build_book_entry(book, version) -> CachedBook:
+    etag, last_modified = book_validators(book.uid, version)
+    body = orjson.dumps(dump(BookReviewViewSchema, book))
+    return CachedBook(etag, last_modified, body)
+
+
+class BookCache:
+    """
+    Read-through redis cache of serialized books with their reviews.
+
+    Concurrent misses for one book are coalesced in-process, and a redis
+    lock lets a single worker load it from the database while the others
+    wait for the entry to appear.
+    """
+
+    def __init__(self, enabled: bool, ttl: int, lock_ms: int) -> None:
+        self.enabled = enabled
+        self.ttl = ttl
+        self.lock_ms = lock_ms
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+        self.errors = 0
+        self.gets = 0
+        self.get_time_total = 0.0
+        self.loads = 0
+        self.load_time_total = 0.0
+        self._inflight = {}
+
+    async def get_or_load(
+        self,
+        book_uid: str,
+        loader: Callable[[], Awaitable[Optional[CachedBook]]]
+    ) -> Optional[CachedBook]:
+        if not self.enabled:
+            return await self._load(loader)
+
+        started_at = time.perf_counter()
+        try:
+            return await self._coalesce(book_uid.lower(), loader)
+        finally:
+            self.gets += 1
+            self.get_time_total += time.perf_counter() - started_at
+
+    async def peek(self, book_uid: str) -> Optional[CachedBook]:
+        # the stored entry if there is one, a miss loads nothing
+        if not self.enabled:
+            return None
+
+        try:
+            value = await redis_client.get(BOOK_KEY_PREFIX + book_uid.lower())
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Book cache lookup failed: {e!r}")
+            return None
+
+        if value is None:
+            return None
+
+        self.hits += 1
+        return CachedBook.decode(value)
+
+    async def _coalesce(self, book_uid: str, loader) -> Optional[CachedBook]:
+        inflight = self._inflight.get(book_uid)
+
+        if inflight is not None:
+            self.coalesced += 1
+            await asyncio.wait({inflight})
+
+            if not inflight.cancelled() and inflight.exception() is None:
+                return inflight.result()
+
+            # the leading request failed, this one loads for itself
+            return await self._load(loader)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[book_uid] = future
+
+        try:
+            entry = await self._fetch(book_uid, loader)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        finally:
+            del self._inflight[book_uid]
+
+        future.set_result(entry)
+        return entry
+
+    async def _fetch(self, book_uid: str, loader) -> Optional[CachedBook]:
+        key = BOOK_KEY_PREFIX + book_uid
+        lock_key = BOOK_LOCK_PREFIX + book_uid
+        token = uuid.uuid4().hex
+
+        try:
+            value = await redis_client.get(key)
+
+            if value is not None:
+                self.hits += 1
+                return CachedBook.decode(value)
+
+            self.misses += 1
+            locked = await redis_client.set(
+                lock_key, token, nx=True, px=self.lock_ms)
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Book cache lookup failed: {e!r}")
+            return await self._load(loader)
+
+        if not locked:
+            # another worker is loading this book, wait for its entry
+            entry = await self._wait_for_entry(key)
+
+            if entry is not None:
+                self.lock_waits += 1
+                return entry
+
+            return await self._load(loader)
+
+        entry = await self._load(loader)
+
+        try:
+            if entry is None:
+                await redis_client.eval(RELEASE_IF_LOCKED, 1, lock_key, token)
+            else:
+                await redis_client.eval(STORE_IF_LOCKED, 2, key, lock_key,
+                                        token, entry.encode(), self.ttl)
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Book cache store failed: {e!r}")
+
+        return entry
+
+    async def _wait_for_entry(self, key: str) -> Optional[CachedBook]:
+        deadline = time.monotonic() + self.lock_ms / 1000
+
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+
+            try:
+                value = await redis_client.get(key)
+            except (RedisError, OSError):
+                return None
+
+            if value is not None:
+                return CachedBook.decode(value)
+
+        return None
+
+    async def _load(self, loader) -> Optional[CachedBook]:
+        started_at = time.perf_counter()
+        try:
+            return await loader()
+        finally:
+            self.loads += 1
+            self.load_time_total += time.perf_counter() - started_at
+
+    async def invalidate(self, book_uid: str) -> None:
+        if not self.enabled:
+            return
+
+        book_uid = str(book_uid).lower()
+
+        try:
+            await redis_client.delete(
+                BOOK_KEY_PREFIX + book_uid, BOOK_LOCK_PREFIX + book_uid)
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Book cache invalidation failed: {e!r}")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'coalesced': self.coalesced,
+            'lock_waits': self.lock_waits,
+            'errors': self.errors,
+            'get_time_avg_ms': (self.get_time_total / self.gets * 1000
+                                if self.gets else 0.0),
+            'load_time_avg_ms': (self.load_time_total / self.loads * 1000
+                                 if self.loads else 0.0)
+        }
+
+
+# create the shared book cache
+book_cache = BookCache(
+    enabled=Config.BOOK_CACHE_ENABLED,
+    ttl=Config.BOOK_CACHE_TTL,
+    lock_ms=Config.BOOK_CACHE_LOCK_MS
+)
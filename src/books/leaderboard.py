@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import sys
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import List, Optional
+from redis.exceptions import RedisError
+from sqlalchemy import func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.config import Config
+from src.db.models import Review
+from src.db.redis import redis_client
+from src.errors import ServiceUnavailable
+
+LEADERBOARD_PREFIX = 'top_books:'
+LEADERBOARD_METRICS = ('rating', 'reviews')
+LEADERBOARD_WINDOWS = {'7d': 7, '30d': 30, 'all': None}
+
+# daily buckets outlive the longest window by a day
+BUCKET_RETENTION_DAYS = 31
+REBUILD_BATCH_SIZE = 1000
+
+# applies a review to the rating and reviews sets of one period, a book
+# leaves both once its last review there is gone, whatever its rating sum
+RECORD_REVIEW = """
+redis.call('zincrby', KEYS[1], ARGV[1], ARGV[3])
+local reviews = tonumber(redis.call('zincrby', KEYS[2], ARGV[2], ARGV[3]))
+if reviews <= 0 then
+    redis.call('zrem', KEYS[1], ARGV[3])
+    redis.call('zrem', KEYS[2], ARGV[3])
+end
+return reviews
+"""
+
+
+def total_key(metric: str) -> str:
+    return f'{LEADERBOARD_PREFIX}{metric}:all'
+
+
+def bucket_key(metric: str, day: date) -> str:
+    return f'{LEADERBOARD_PREFIX}{metric}:{day:%Y%m%d}'
+
+
+def window_key(metric: str, window: str) -> str:
+    return f'{LEADERBOARD_PREFIX}{metric}:{window}'
+
+
+def bucket_expires_at(day: date) -> datetime:
+    return datetime.combine(
+        day + timedelta(days=BUCKET_RETENTION_DAYS), time(), timezone.utc)
+
+
+def utc_today() -> date:
+    return datetime.now(timezone.utc).date()
+
+
+class Leaderboard:
+    """
+    Books ranked by the sum of their ratings and by their number of reviews.
+
+    Every metric has an all-time sorted set and one sorted set per UTC day.
+    Sliding windows are the union of their daily buckets, cached briefly.
+    """
+
+    def __init__(self, window_cache_seconds: int) -> None:
+        self.window_cache_seconds = window_cache_seconds
+        self.errors = 0
+
+    async def record_review(self,
+                            book_uid,
+                            rating: int,
+                            created_at: Optional[datetime],
+                            delta: int) -> None:
+        # called once the review is committed, a failure here only leaves
+        # the leaderboard behind until the next rebuild
+        book_uid = str(book_uid).lower()
+        day = created_at.astimezone(timezone.utc).date() if created_at else utc_today()
+        in_buckets = (utc_today() - day).days < BUCKET_RETENTION_DAYS
+
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                pipe.eval(RECORD_REVIEW, 2, total_key('rating'),
+                          total_key('reviews'), rating * delta, delta, book_uid)
+
+                if in_buckets:
+                    keys = [bucket_key(metric, day) for metric in LEADERBOARD_METRICS]
+                    pipe.eval(RECORD_REVIEW, 2, *keys,
+                              rating * delta, delta, book_uid)
+
+                    for key in keys:
+                        pipe.expireat(key, bucket_expires_at(day))
+
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Leaderboard update failed: {e!r}")
+
+    async def remove_book(self, book_uid) -> None:
+        # a deleted book leaves every set it could rank in, otherwise it
+        # holds a place in the top list until its buckets expire
+        book_uid = str(book_uid).lower()
+        today = utc_today()
+        keys = [
+            key
+            for metric in LEADERBOARD_METRICS
+            for key in (
+                total_key(metric),
+                *(window_key(metric, window)
+                  for window, days in LEADERBOARD_WINDOWS.items() if days),
+                *(bucket_key(metric, today - timedelta(days=i))
+                  for i in range(BUCKET_RETENTION_DAYS))
+            )
+        ]
+
+        try:
+            async with redis_client.pipeline(transaction=True) as pipe:
+                for key in keys:
+                    pipe.zrem(key, book_uid)
+                await pipe.execute()
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Leaderboard removal failed: {e!r}")
+
+    async def top(self, window: str, sort: str, limit: int) -> List[dict]:
+        try:
+            keys = await self._window_keys(window)
+            ranked = await redis_client.zrevrange(
+                keys[sort], 0, limit - 1, withscores=True)
+
+            other = 'reviews' if sort == 'rating' else 'rating'
+            other_scores = (await redis_client.zmscore(
+                keys[other], [book_uid for book_uid, _ in ranked])
+                if ranked else [])
+        except (RedisError, OSError) as e:
+            self.errors += 1
+            logging.warning(f"Leaderboard lookup failed: {e!r}")
+            raise ServiceUnavailable()
+
+        return [
+            {'book_uid': book_uid, sort: int(score), other: int(other_score or 0)}
+            for (book_uid, score), other_score in zip(ranked, other_scores)
+        ]
+
+    async def _window_keys(self, window: str) -> dict:
+        days = LEADERBOARD_WINDOWS[window]
+
+        if days is None:
+            return {metric: total_key(metric) for metric in LEADERBOARD_METRICS}
+
+        keys = {metric: window_key(metric, window)
+                for metric in LEADERBOARD_METRICS}
+
+        if await redis_client.exists(*keys.values()) == len(keys):
+            return keys
+
+        # missing buckets count as empty sets
+        today = utc_today()
+        async with redis_client.pipeline(transaction=True) as pipe:
+            for metric, key in keys.items():
+                pipe.zunionstore(key, [bucket_key(metric, today - timedelta(days=i))
+                                       for i in range(days)])
+                pipe.expire(key, self.window_cache_seconds)
+            await pipe.execute()
+
+        return keys
+
+    async def rebuild(self, session: AsyncSession) -> int:
+        """
+        Regenerate every sorted set from the reviews in postgres.
+
+        The new sets replace the old ones in a single transaction, so
+        readers never see a half built leaderboard.
+        """
+        review_day = func.date(func.timezone('UTC', Review.created_at))
+        statement = select(
+            Review.book_uid,
+            review_day,
+            func.count(),
+            func.sum(Review.rating)
+        ).where(Review.book_uid.is_not(None)).group_by(
+            Review.book_uid, review_day
+        ).execution_options(yield_per=REBUILD_BATCH_SIZE)
+
+        since = utc_today() - timedelta(days=BUCKET_RETENTION_DAYS - 1)
+        scores = defaultdict(lambda: defaultdict(int))
+        bucket_days = {}
+
+        result = await session.stream(statement)
+        async for book_uid, day, reviews, rating in result:
+            book_uid = str(book_uid).lower()
+
+            for metric, amount in (('rating', rating), ('reviews', reviews)):
+                scores[total_key(metric)][book_uid] += amount
+
+                if day is not None and day >= since:
+                    key = bucket_key(metric, day)
+                    scores[key][book_uid] += amount
+                    bucket_days[key] = day
+
+        old_keys = [key async for key in
+                    redis_client.scan_iter(match=LEADERBOARD_PREFIX + '*')]
+
+        async with redis_client.pipeline(transaction=True) as pipe:
+            if old_keys:
+                pipe.delete(*old_keys)
+
+            # every book here has reviews, a rating sum of 0 still ranks
+            for key, members in scores.items():
+                pipe.zadd(key, members)
+
+                if key in bucket_days:
+                    pipe.expireat(key, bucket_expires_at(bucket_days[key]))
+
+            await pipe.execute()
+
+        return len(scores[total_key('reviews')])
+
+
+# create the shared leaderboard
+leaderboard = Leaderboard(
+    window_cache_seconds=Config.LEADERBOARD_WINDOW_CACHE_SECONDS
+)
+
+
+async def main() -> int:
+    from src.db.main import async_engine, async_session_maker
+
+    try:
+        async with async_session_maker() as session:
+            books = await leaderboard.rebuild(session)
+    finally:
+        await async_engine.dispose()
+
+    print(f'Rebuilt the leaderboard from the reviews of {books} books')
+    return 0
+
+
+# python -m src.books.leaderboard, regenerates the leaderboard from postgres
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
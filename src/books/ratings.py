@@ -0,0 +1,111 @@
+import asyncio
+import sys
+from sqlalchemy import Integer, Update, case, func, literal, or_, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src.books.cache import book_cache
+from src.db.models import Book, Review
+
+
+def rating_update(book_uid, rating: int, delta: int) -> Update:
+    """
+    Add (delta=1) or remove (delta=-1) one rating from a book's aggregates.
+
+    The arithmetic runs inside the UPDATE, so concurrent reviews of one
+    book serialize on its row lock instead of overwriting each other.
+    """
+    key = str(rating)
+    count = func.coalesce(
+        Book.rating_histogram[key].astext.cast(Integer), 0) + delta
+
+    return update(Book).where(Book.uid == book_uid).values(
+        review_count=Book.review_count + delta,
+        rating_sum=Book.rating_sum + delta * rating,
+        # ratings nobody gave anymore are dropped, like the repair does
+        rating_histogram=case(
+            (count > 0, Book.rating_histogram.op('||')(
+                func.jsonb_build_object(literal(key), count))),
+            else_=Book.rating_histogram.op('-')(literal(key))
+        ),
+        # aggregates are not an edit of the book itself
+        updated_at=Book.updated_at
+    ).returning(Book.uid).execution_options(synchronize_session=False)
+
+
+async def repair_ratings(session: AsyncSession) -> list:
+    """
+    Recompute the rating aggregates of every book from its reviews.
+
+    Only books whose stored aggregates are off are written, their uids
+    are returned.
+    """
+    per_rating = select(
+        Review.book_uid,
+        Review.rating,
+        func.count().label('reviews')
+    ).where(Review.book_uid.is_not(None)).group_by(
+        Review.book_uid, Review.rating).subquery()
+
+    per_book = select(
+        per_rating.c.book_uid,
+        func.sum(per_rating.c.reviews).label('review_count'),
+        func.sum(per_rating.c.rating * per_rating.c.reviews).label('rating_sum'),
+        func.jsonb_object_agg(
+            per_rating.c.rating, per_rating.c.reviews).label('rating_histogram')
+    ).group_by(per_rating.c.book_uid).subquery()
+
+    recount = update(Book).where(
+        Book.uid == per_book.c.book_uid,
+        or_(
+            Book.review_count != per_book.c.review_count,
+            Book.rating_sum != per_book.c.rating_sum,
+            Book.rating_histogram != per_book.c.rating_histogram
+        )
+    ).values(
+        review_count=per_book.c.review_count,
+        rating_sum=per_book.c.rating_sum,
+        rating_histogram=per_book.c.rating_histogram,
+        updated_at=Book.updated_at
+    ).returning(Book.uid)
+
+    # books that lost all their reviews are not in the aggregate at all
+    reset = update(Book).where(
+        or_(Book.review_count != 0, Book.rating_sum != 0,
+            Book.rating_histogram != func.jsonb_build_object()),
+        ~select(Review.uid).where(Review.book_uid == Book.uid).exists()
+    ).values(
+        review_count=0,
+        rating_sum=0,
+        rating_histogram=func.jsonb_build_object(),
+        updated_at=Book.updated_at
+    ).returning(Book.uid)
+
+    repaired = []
+    for statement in (recount, reset):
+        result = await session.execute(
+            statement, execution_options={'synchronize_session': False})
+        repaired.extend(result.scalars().all())
+
+    await session.commit()
+
+    for book_uid in repaired:
+        await book_cache.invalidate(book_uid)
+
+    return repaired
+
+
+async def main() -> int:
+    from src.db.main import async_engine, async_session_maker
+
+    try:
+        async with async_session_maker() as session:
+            repaired = await repair_ratings(session)
+    finally:
+        await async_engine.dispose()
+
+    print(f'Repaired the rating aggregates of {len(repaired)} books')
+    return 0
+
+
+# python -m src.books.ratings, recomputes every book's rating aggregates
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
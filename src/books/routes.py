@@ -1,13 +1,25 @@
 from src.books.service import BookService
 from sqlmodel.ext.asyncio.session import AsyncSession
-from src.db.main import get_session
-from fastapi import APIRouter, status, Depends
+from src.db.main import get_session, get_read_session, get_read_session_maker
+from src.db.models import Book
+from fastapi import APIRouter, status, Depends, Query, Request
 from fastapi.exceptions import HTTPException
-from typing import List
+from typing import Optional, Literal
+import orjson
 from src.books.schemas import (BookViewSchema,
                                BookCreateSchema,
                                BookUpdateSchema,
-                               BookReviewViewSchema)
+                               BookReviewViewSchema,
+                               BookPageSchema,
+                               BookSearchPageSchema,
+                               BookTopPageSchema,
+                               BookBulkResultSchema)
+from src.db.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.responses import schema_response, export_response
+from src.conditional import (has_conditions,
+                             is_not_modified,
+                             not_modified_response)
+from src.books.cache import book_cache, book_validators
 from src.auth.dependencies import AccessTokenBearer, RoleChecker
 from src.errors import BookNotFound
 
@@ -23,30 +35,84 @@ access_token_bearer = AccessTokenBearer()
 
 # create an instance of role checker
 role_checker = RoleChecker(['admin', 'user'])
+admin_role_checker = RoleChecker(['admin'])
 
 
-# get all the books
-@book_router.get('', response_model=List[BookViewSchema],
+# get all the books, one page at a time
+@book_router.get('', response_model=BookPageSchema,
                  status_code=status.HTTP_200_OK,
                  dependencies=[Depends(role_checker)])
 async def get_all_books(
-    session: AsyncSession = Depends(get_session),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session),
     token_details: dict = Depends(access_token_bearer)
-) -> List:
-    books = await book_service.get_all_books(session)
-    return books
+) -> dict:
+    page = await book_service.get_all_books(session, limit, cursor)
+    return schema_response(BookPageSchema, page)
 
-# get books by user_uid
-@book_router.get('/user/{user_uid}', response_model=List[BookViewSchema],
+# get books by user_uid, one page at a time
+@book_router.get('/user/{user_uid}', response_model=BookPageSchema,
                  status_code=status.HTTP_200_OK,
                  dependencies=[Depends(role_checker)])
 async def get_books_by_user(
     user_uid: str,
-    session: AsyncSession = Depends(get_session),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session),
+    token_details: dict = Depends(access_token_bearer)
+) -> dict:
+    page = await book_service.get_books_by_user(
+        user_uid, session, limit, cursor)
+    return schema_response(BookPageSchema, page)
+
+
+# search books by title, author and publisher, best matches first
+@book_router.get('/search', response_model=BookSearchPageSchema,
+                 status_code=status.HTTP_200_OK,
+                 dependencies=[Depends(role_checker)])
+async def search_books(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_read_session),
+    token_details: dict = Depends(access_token_bearer)
+) -> dict:
+    page = await book_service.search_books(q, session, limit, cursor)
+    return schema_response(BookSearchPageSchema, page)
+
+
+# get the best rated or most reviewed books of a time window
+@book_router.get('/top', response_model=BookTopPageSchema,
+                 status_code=status.HTTP_200_OK,
+                 dependencies=[Depends(role_checker)])
+async def get_top_books(
+    window: Literal['7d', '30d', 'all'] = '7d',
+    sort: Literal['rating', 'reviews'] = 'rating',
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    session: AsyncSession = Depends(get_read_session),
     token_details: dict = Depends(access_token_bearer)
-) -> List:
-    books = await book_service.get_books_by_user(user_uid, session)
-    return books
+) -> dict:
+    books = await book_service.get_top_books(window, sort, limit, session)
+    return schema_response(BookTopPageSchema, {'window': window, 'books': books})
+
+
+# export every book as ndjson or csv
+@book_router.get('/export',
+                 status_code=status.HTTP_200_OK,
+                 dependencies=[Depends(admin_role_checker)])
+async def export_books(
+    request: Request,
+    export_format: Literal['ndjson', 'csv'] = Query(
+        default='ndjson', alias='format')
+):
+    return export_response(
+        get_read_session_maker(request),
+        Book.__table__,
+        BookViewSchema,
+        export_format,
+        'books'
+    )
 
 
 # get the book by ID
@@ -55,16 +121,40 @@ async def get_books_by_user(
                  dependencies=[Depends(role_checker)])
 async def get_book(
     book_uid: str,
-    session: AsyncSession = Depends(get_session),
+    request: Request,
+    session: AsyncSession = Depends(get_read_session),
     token_details: dict = Depends(access_token_bearer)
 ) -> BookReviewViewSchema:
-    book = await book_service.get_book(book_uid, session)
+    # revalidation is answered from the validators of a cached entry, or
+    # else from the book's version, before anything is loaded
+    if has_conditions(request):
+        book = await book_cache.peek(book_uid)
 
-    if book:
-        return book
-    else:
+        if book is not None:
+            if is_not_modified(request, book.etag, book.last_modified):
+                return not_modified_response(book.etag, book.last_modified)
+
+            return book.response()
+
+        version = await book_service.get_book_version(book_uid, session)
+
+        if not version:
+            raise BookNotFound()
+
+        etag, last_modified = book_validators(book_uid, version)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified)
+
+    book = await book_service.get_cached_book(book_uid, session)
+
+    if not book:
         raise BookNotFound()
 
+    if is_not_modified(request, book.etag, book.last_modified):
+        return not_modified_response(book.etag, book.last_modified)
+
+    return book.response()
+
 
 # add a book to the list
 @book_router.post('',
@@ -81,6 +171,57 @@ async def create_book(
     return book
 
 
+async def _read_bulk_rows(request: Request):
+    # ndjson bodies are split into lines as they arrive and each line is
+    # parsed by the schema, anything else must be a json array
+    if request.headers.get('content-type', '').startswith('application/x-ndjson'):
+        index = 0
+        buffer = b''
+
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+
+        if buffer.strip():
+            yield index, buffer
+        return
+
+    try:
+        rows = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        rows = None
+
+    if not isinstance(rows, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a JSON array or NDJSON body"
+        )
+
+    for index, row in enumerate(rows):
+        yield index, row
+
+
+# add many books at once
+@book_router.post('/bulk',
+                  response_model=BookBulkResultSchema,
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(role_checker)])
+async def create_books_bulk(
+    request: Request,
+    session: AsyncSession = Depends(get_session),
+    token_details: dict = Depends(access_token_bearer)
+) -> dict:
+    user_uid = token_details.get('user')['user_uid']
+    result = await book_service.create_books_bulk(
+        _read_bulk_rows(request), user_uid, session)
+    return result
+
+
 # update a book
 @book_router.patch('/{book_uid}',
                    response_model=BookViewSchema,
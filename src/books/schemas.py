@@ -1,7 +1,7 @@
 from pydantic import BaseModel
 from datetime import datetime, date
 import uuid
-from typing import List
+from typing import Dict, List, Optional
 from src.reviews.schemas import ReviewViewSchema
 
 
@@ -14,6 +14,9 @@ class BookViewSchema(BaseModel):
     published_date: date
     page_count: int
     language: str
+    review_count: int
+    rating_sum: int
+    rating_histogram: Dict[str, int]
     created_at: datetime
     updated_at: datetime
 
@@ -22,18 +25,62 @@ class BookReviewViewSchema(BookViewSchema):
     reviews: List[ReviewViewSchema]
 
 
-class BookCreateSchema(BaseModel):
+class BookPageSchema(BaseModel):
+    books: List[BookViewSchema]
+    next_cursor: Optional[str]
+
+
+# html-escaped text, only the matches are wrapped in <mark> tags
+class BookHighlightSchema(BaseModel):
     title: str
     author: str
     publisher: str
-    published_date: str
-    page_count: int
-    language: str
 
 
-class BookUpdateSchema(BaseModel):
+class BookSearchResultSchema(BookViewSchema):
+    rank: float
+    highlights: BookHighlightSchema
+
+
+class BookSearchPageSchema(BaseModel):
+    results: List[BookSearchResultSchema]
+    next_cursor: Optional[str]
+
+
+class BookTopSchema(BookViewSchema):
+    window_rating_sum: int
+    window_review_count: int
+
+
+class BookTopPageSchema(BaseModel):
+    window: str
+    books: List[BookTopSchema]
+
+
+class BookCreateSchema(BaseModel):
     title: str
     author: str
     publisher: str
+    published_date: str
     page_count: int
     language: str
+
+
+class BookBulkErrorSchema(BaseModel):
+    index: int
+    errors: List[str]
+
+
+class BookBulkResultSchema(BaseModel):
+    inserted: int
+    failed: int
+    errors: List[BookBulkErrorSchema]
+
+
+# only the fields sent are updated
+class BookUpdateSchema(BaseModel):
+    title: Optional[str] = None
+    author: Optional[str] = None
+    publisher: Optional[str] = None
+    page_count: Optional[int] = None
+    language: Optional[str] = None
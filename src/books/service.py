@@ -1,67 +1,388 @@
 from sqlmodel.ext.asyncio.session import AsyncSession
 from .schemas import BookCreateSchema, BookUpdateSchema
 from sqlmodel import select, desc
-from src.db.models import Book
-from datetime import datetime
+from sqlalchemy import tuple_, insert, update, delete, func, literal_column
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.orm import selectinload
+from pydantic import ValidationError
+from src.db.models import Book, Review
+from src.db.loader import load_one, parse_uuid
+from src.db.main import async_session_maker
+from src.books.cache import book_cache, build_book_entry
+from src.books.leaderboard import leaderboard
+from src.db.pagination import encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE
+from src.books.schemas import BookViewSchema
+from src.responses import dump
+from src.errors import InvalidCursor
+from datetime import datetime, date
+from typing import Any, AsyncIterator, List, Optional, Tuple
+import html
+import logging
+import uuid
+
+BULK_INSERT_CHUNK_SIZE = 1000
+
+# generated by postgres (see the search vector migration), so it is not
+# part of the model and is never loaded with a book
+SEARCH_VECTOR = literal_column('books.search_vector')
+SEARCH_CONFIG = 'english'
+
+# postgres marks the matches with private use characters, the headline is
+# html-escaped before they become <mark> tags, so markup stored in a title
+# comes back as text
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+SEARCH_HEADLINE_OPTIONS = (f'StartSel="{HIGHLIGHT_START}", '
+                           f'StopSel="{HIGHLIGHT_STOP}", HighlightAll=true')
+
+
+def render_highlight(headline: str) -> str:
+    return html.escape(headline).replace(
+        HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>')
+
+
+def database_error(error: DBAPIError) -> str:
+    # the driver's own message, without the wrapping exception class names
+    original = error.orig.__cause__ or error.orig
+    return str(original).splitlines()[0]
 
 
 class BookService:
 
-    async def get_all_books(self, session: AsyncSession):
-        statement = select(Book).order_by(desc(Book.created_at))
+    async def get_all_books(self,
+                            session: AsyncSession,
+                            limit: int = DEFAULT_PAGE_SIZE,
+                            cursor: Optional[str] = None):
+        statement = select(Book)
+        return await self._paginate(statement, limit, cursor, session)
+
+    async def get_books_by_user(self,
+                                user_uid: str,
+                                session: AsyncSession,
+                                limit: int = DEFAULT_PAGE_SIZE,
+                                cursor: Optional[str] = None):
+        statement = select(Book).where(Book.user_uid == user_uid)
+        return await self._paginate(statement, limit, cursor, session)
+
+    async def _paginate(self, statement, limit: int, cursor: Optional[str],
+                        session: AsyncSession):
+        # keyset pagination, newest first, uid breaks ties on created_at
+        if cursor:
+            created_at, uid = decode_cursor(cursor, 2)
+            try:
+                created_at = datetime.fromisoformat(created_at)
+                uid = uuid.UUID(uid)
+            except (ValueError, TypeError):
+                raise InvalidCursor()
+
+            statement = statement.where(
+                tuple_(Book.created_at, Book.uid) < (created_at, uid))
+
+        statement = statement.order_by(
+            desc(Book.created_at), desc(Book.uid)).limit(limit + 1)
+        result = await session.exec(statement)
+        books = result.all()
+
+        next_cursor = None
+        if len(books) > limit:
+            books = books[:limit]
+            last_book = books[-1]
+            next_cursor = encode_cursor([last_book.created_at, last_book.uid])
+
+        return {'books': books, 'next_cursor': next_cursor}
+
+    async def search_books(self,
+                           q: str,
+                           session: AsyncSession,
+                           limit: int = DEFAULT_PAGE_SIZE,
+                           cursor: Optional[str] = None):
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+        rank = func.ts_rank_cd(SEARCH_VECTOR, query)
+
+        # rank and page on the GIN index first, the headlines are costly so
+        # they are only built for the rows of this page
+        ranked = select(Book.uid, rank.label('rank')).where(
+            SEARCH_VECTOR.op('@@')(query))
+
+        if cursor:
+            last_rank, uid = decode_cursor(cursor, 2)
+            try:
+                last_rank = float(last_rank)
+                uid = uuid.UUID(uid)
+            except (ValueError, TypeError):
+                raise InvalidCursor()
+
+            ranked = ranked.where(tuple_(rank, Book.uid) < (last_rank, uid))
+
+        ranked = ranked.order_by(
+            desc(rank), desc(Book.uid)).limit(limit + 1).subquery()
+
+        statement = select(
+            Book,
+            ranked.c.rank,
+            func.ts_headline(SEARCH_CONFIG, Book.title, query,
+                             SEARCH_HEADLINE_OPTIONS),
+            func.ts_headline(SEARCH_CONFIG, Book.author, query,
+                             SEARCH_HEADLINE_OPTIONS),
+            func.ts_headline(SEARCH_CONFIG, Book.publisher, query,
+                             SEARCH_HEADLINE_OPTIONS)
+        ).join(ranked, ranked.c.uid == Book.uid).order_by(
+            desc(ranked.c.rank), desc(Book.uid))
+
         result = await session.exec(statement)
-        return result.all()
+        rows = result.all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_book, last_rank = rows[-1][:2]
+            next_cursor = encode_cursor([last_rank, last_book.uid])
+
+        results = [
+            {
+                **dump(BookViewSchema, book),
+                'rank': book_rank,
+                'highlights': {
+                    'title': render_highlight(title),
+                    'author': render_highlight(author),
+                    'publisher': render_highlight(publisher)
+                }
+            }
+            for book, book_rank, title, author, publisher in rows
+        ]
+
+        return {'results': results, 'next_cursor': next_cursor}
+
+    async def get_top_books(self,
+                            window: str,
+                            sort: str,
+                            limit: int,
+                            session: AsyncSession):
+        # the ranking comes from redis, postgres only fills in the books
+        ranked = await leaderboard.top(window, sort, limit)
+
+        if not ranked:
+            return []
 
-    async def get_books_by_user(self, user_uid: str, session: AsyncSession):
         statement = select(Book).where(
-            Book.user_uid == user_uid).order_by(desc(Book.created_at))
+            Book.uid.in_([entry['book_uid'] for entry in ranked]))
         result = await session.exec(statement)
-        return result.all()
+        books = {str(book.uid): book for book in result.all()}
+
+        # books deleted since they were reviewed are skipped
+        return [
+            {
+                **dump(BookViewSchema, books[entry['book_uid']]),
+                'window_rating_sum': entry['rating'],
+                'window_review_count': entry['reviews']
+            }
+            for entry in ranked if entry['book_uid'] in books
+        ]
+
+    async def get_book(self,
+                       book_uid: str,
+                       session: AsyncSession,
+                       load_reviews: bool = True):
+        if not load_reviews:
+            return await load_one(session, Book, Book.uid, book_uid)
+
+        statement = select(Book).where(Book.uid == book_uid).options(
+            selectinload(Book.reviews))
 
-    async def get_book(self, book_uid: str, session: AsyncSession):
-        statement = select(Book).where(Book.uid == book_uid)
         result = await session.exec(statement)
         book = result.first()
 
         return book if book else None
 
+    async def get_book_version(self, book_uid: str, session: AsyncSession):
+        # enough to answer a conditional request, without loading the book
+        # or its reviews
+        statement = select(
+            Book.updated_at,
+            func.count(Review.uid),
+            func.max(Review.updated_at)
+        ).select_from(Book).outerjoin(
+            Review, Review.book_uid == Book.uid
+        ).where(Book.uid == book_uid).group_by(Book.uid)
+
+        result = await session.exec(statement)
+        return result.first()
+
+    async def get_cached_book(self, book_uid: str, session: AsyncSession):
+        async def load_book_entry():
+            # a shared entry is served to every client for its whole ttl, so
+            # it is filled from the primary, never from a lagging replica
+            if book_cache.enabled:
+                async with async_session_maker() as primary_session:
+                    book = await self.get_book(book_uid, primary_session)
+            else:
+                book = await self.get_book(book_uid, session)
+
+            if not book:
+                return None
+
+            return build_book_entry(book, self.get_loaded_book_version(book))
+
+        return await book_cache.get_or_load(book_uid, load_book_entry)
+
+    def get_loaded_book_version(self, book: Book):
+        review_times = [review.updated_at for review in book.reviews]
+        return (book.updated_at,
+                len(review_times),
+                max(review_times, default=None))
+
     async def create_book(self,
                           book_data: BookCreateSchema,
                           user_uid: str,
                           session: AsyncSession):
         book_data_dict = book_data.model_dump()
         book = Book(**book_data_dict)
-        book.published_date = datetime.strptime(
-            book_data_dict['published_date'],
-            "%Y-%m-%d")
+        book.published_date = date.fromisoformat(
+            book_data_dict['published_date'])
         book.user_uid = user_uid
         session.add(book)
         await session.commit()
         await session.refresh(book)
         return book
 
+    async def create_books_bulk(self,
+                                rows: AsyncIterator[Tuple[int, Any]],
+                                user_uid: str,
+                                session: AsyncSession):
+        # rows are validated one by one but inserted and committed in chunks,
+        # a failing chunk is retried row by row to find its bad rows
+        inserted = 0
+        errors = []
+        chunk = []
+
+        async for index, row in rows:
+            try:
+                if isinstance(row, bytes):
+                    book_data = BookCreateSchema.model_validate_json(row)
+                else:
+                    book_data = BookCreateSchema.model_validate(row)
+                book_data_dict = book_data.model_dump()
+                book_data_dict['published_date'] = date.fromisoformat(
+                    book_data_dict['published_date'])
+            except ValidationError as e:
+                errors.append({
+                    'index': index,
+                    'errors': [
+                        ': '.join(filter(None, (
+                            '.'.join(map(str, error['loc'])), error['msg'])))
+                        for error in e.errors()
+                    ]
+                })
+                continue
+            except (ValueError, TypeError) as e:
+                errors.append({'index': index, 'errors': [str(e)]})
+                continue
+
+            book_data_dict['user_uid'] = user_uid
+            chunk.append((index, book_data_dict))
+
+            if len(chunk) >= BULK_INSERT_CHUNK_SIZE:
+                inserted += await self._insert_chunk(chunk, errors, session)
+                chunk = []
+
+        if chunk:
+            inserted += await self._insert_chunk(chunk, errors, session)
+
+        errors.sort(key=lambda error: error['index'])
+        return {'inserted': inserted, 'failed': len(errors), 'errors': errors}
+
+    async def _insert_chunk(self,
+                            chunk: List[Tuple[int, dict]],
+                            errors: list,
+                            session: AsyncSession) -> int:
+        # one multi-row INSERT ... RETURNING per batch of parameters
+        try:
+            result = await session.execute(
+                insert(Book).returning(Book.uid),
+                [book_data_dict for _, book_data_dict in chunk]
+            )
+            book_uids = result.scalars().all()
+            await session.commit()
+        except SQLAlchemyError as e:
+            logging.warning(f"Bulk insert chunk failed, retrying row by row: {e!r}")
+            await session.rollback()
+            return await self._insert_rows(chunk, errors, session)
+
+        return len(book_uids)
+
+    async def _insert_rows(self,
+                           chunk: List[Tuple[int, dict]],
+                           errors: list,
+                           session: AsyncSession) -> int:
+        # every row gets a savepoint, so the good rows of the chunk still go
+        # in and each bad one is reported with its own database error
+        inserted = []
+
+        for index, book_data_dict in chunk:
+            try:
+                async with session.begin_nested():
+                    await session.execute(insert(Book), [book_data_dict])
+                inserted.append(index)
+            except DBAPIError as e:
+                errors.append({'index': index, 'errors': [database_error(e)]})
+
+        try:
+            await session.commit()
+        except SQLAlchemyError as e:
+            logging.exception(e)
+            await session.rollback()
+            errors.extend(
+                {'index': index, 'errors': ['Failed to commit the batch of this row']}
+                for index in inserted
+            )
+            return 0
+
+        return len(inserted)
+
     async def update_book(
         self, book_uid: str, book_data: BookUpdateSchema, session: AsyncSession
     ):
-        book = await self.get_book(book_uid, session)
+        # a null counts as not sent, none of the columns are nullable
+        book_data_dict = book_data.model_dump(exclude_unset=True, exclude_none=True)
 
-        if not book:
+        if not book_data_dict:
+            return await self.get_book(book_uid, session, load_reviews=False)
+
+        book_uid = parse_uuid(book_uid)
+        if book_uid is None:
             return None
 
-        book_data_dict = book_data.model_dump()
-        for key, value in book_data_dict.items():
-            setattr(book, key, value)
+        # one UPDATE ... RETURNING, no row means no such book
+        result = await session.execute(
+            update(Book).where(Book.uid == book_uid).values(
+                **book_data_dict).returning(Book),
+            execution_options={'synchronize_session': False}
+        )
+        book = result.scalars().first()
+
+        if not book:
+            return None
 
         await session.commit()
-        await session.refresh(book)
+        await book_cache.invalidate(book.uid)
         return book
 
     async def delete_book(self, book_uid: str, session: AsyncSession):
-        book = await self.get_book(book_uid, session)
+        book_uid = parse_uuid(book_uid)
+        if book_uid is None:
+            return None
 
-        if not book:
+        # reviews keep existing, postgres clears their book_uid
+        result = await session.execute(
+            delete(Book).where(Book.uid == book_uid).returning(Book.uid),
+            execution_options={'synchronize_session': False}
+        )
+        deleted_uid = result.scalars().first()
+
+        if not deleted_uid:
             return None
 
-        await session.delete(book)
         await session.commit()
-        return book
+        await book_cache.invalidate(deleted_uid)
+        await leaderboard.remove_book(deleted_uid)
+        return deleted_uid
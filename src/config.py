@@ -8,6 +8,87 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str
     REDIS_URL: str
 
+    # database connection pool
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = False
+
+    # comma separated read replicas, reads stick to the primary after a write
+    # through the bookly_primary_until cookie, clients without a cookie jar
+    # send back the X-Bookly-Primary-Until response header instead
+    DATABASE_REPLICA_URLS: str = ''
+    REPLICA_STICKY_SECONDS: int = 5
+
+    # authenticated-principal cache
+    PRINCIPAL_CACHE_TTL: int = 60
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_REDIS: bool = False
+
+    # authorize from the role claim of the access token
+    ROLE_CLAIMS_AUTHORIZATION: bool = True
+
+    # verified tokens, kept until they expire
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000
+
+    # local filter of revoked token ids
+    JTI_FILTER_ENABLED: bool = True
+    JTI_FILTER_CAPACITY: int = 100000
+    JTI_FILTER_ERROR_RATE: float = 0.001
+    JTI_FILTER_RESYNC_SECONDS: int = 60
+
+    # circuit breaker around the redis blocklist check
+    JTI_BLOCKLIST_TIMEOUT: float = 0.25
+    JTI_BLOCKLIST_FAIL_OPEN: bool = False
+    REDIS_BREAKER_FAILURES: int = 5
+    REDIS_BREAKER_RESET_SECONDS: int = 10
+
+    # bcrypt worker pool, 'thread' or 'process'
+    PASSWORD_HASH_EXECUTOR: str = 'thread'
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    # read-through cache of single books with their reviews
+    BOOK_CACHE_ENABLED: bool = True
+    BOOK_CACHE_TTL: int = 300
+    BOOK_CACHE_LOCK_MS: int = 1000
+
+    # refuse to start when the database schema differs from the models
+    SCHEMA_CHECK_ON_STARTUP: bool = True
+
+    # how long a sliding window leaderboard is reused before it is rebuilt
+    # from the daily buckets
+    LEADERBOARD_WINDOW_CACHE_SECONDS: int = 60
+
+    # comma separated path prefixes that may be called without an
+    # Authorization header
+    AUTH_EXEMPT_PATH_PREFIXES: str = (
+        '/api/v1/auth/login,/api/v1/auth/signup,/docs,/redoc,/openapi.json,'
+        '/metrics'
+    )
+
+    # json access log, successful requests are sampled, errors and
+    # requests slower than the threshold are always logged
+    ACCESS_LOG_ENABLED: bool = True
+    ACCESS_LOG_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_SLOW_MS: int = 500
+    ACCESS_LOG_QUEUE_SIZE: int = 10000
+
+    # prometheus metrics, every worker writes a snapshot into the shared
+    # directory and /metrics sums them, by default the directory is private
+    # to the workers of one server process
+    METRICS_ENABLED: bool = True
+    METRICS_DIR: str = ''
+    METRICS_FLUSH_SECONDS: int = 5
+
+    # a warning when a request repeats the same statement more often than
+    # the threshold, the timing of its db, redis, auth and serialize phases
+    # is only sent in the Server-Timing header when enabled, as it tells
+    # any client how the server spends its time
+    SERVER_TIMING_ENABLED: bool = False
+    REPEATED_QUERY_THRESHOLD: int = 5
+
     model_config = SettingsConfigDict(
         env_file='.env',
         extra='ignore'
@@ -0,0 +1,50 @@
+import time
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for reset_timeout seconds after
+    failure_threshold consecutive failures, then lets one probe through.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+
+        return 'open'
+
+    def allow_request(self) -> bool:
+        state = self.state
+
+        if state == 'half_open':
+            # re-arm the timer so only this request probes the dependency
+            self.opened_at = time.monotonic()
+            return True
+
+        return state == 'closed'
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures
+        }
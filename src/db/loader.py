@@ -0,0 +1,167 @@
+import asyncio
+import uuid
+from typing import Any, Optional
+from sqlalchemy import Uuid, any_, bindparam, event
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import InstrumentedAttribute, Session
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+LOADERS_KEY = 'loaders'
+LOADERS_LOCK_KEY = 'loaders_lock'
+
+_MISSING = object()
+
+
+class Loader:
+    """
+    Batches lookups of one model by one unique column.
+
+    Keys requested within the same event loop tick are fetched together
+    with a single `column = ANY(:keys)` query. Results, including misses,
+    are kept for the rest of the session's transaction.
+    """
+
+    def __init__(self,
+                 session: AsyncSession,
+                 model: type,
+                 column: InstrumentedAttribute,
+                 lock: asyncio.Lock) -> None:
+        self.session = session
+        self.model = model
+        self.column = column
+        self.lock = lock
+        self.is_uuid = isinstance(column.type, Uuid)
+        self.cache = {}
+        self.queue = []
+        self.batches = 0
+        self._tasks = set()
+
+    def load(self, key: Any) -> asyncio.Future:
+        key = self._normalize(key)
+        future = self.cache.get(key)
+
+        if future is not None:
+            return future
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.cache[key] = future
+
+        if key is _MISSING:
+            future.set_result(None)
+            return future
+
+        self.queue.append(key)
+
+        # the first key of a batch schedules the query for the next tick,
+        # everything requested until then joins it
+        if len(self.queue) == 1:
+            loop.call_soon(self._schedule_dispatch)
+
+        return future
+
+    def _schedule_dispatch(self) -> None:
+        task = asyncio.get_running_loop().create_task(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def prime(self, key: Any, instance: Any) -> None:
+        # a row loaded through another column, a pending load is left alone
+        key = self._normalize(key)
+        future = self.cache.get(key)
+
+        if future is None or future.done():
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(instance)
+            self.cache[key] = future
+
+    def clear(self) -> None:
+        self.cache = {key: future for key, future in self.cache.items()
+                      if not future.done()}
+
+    async def _dispatch(self) -> None:
+        keys, self.queue = self.queue, []
+        self.batches += 1
+
+        statement = select(self.model).where(self.column == any_(
+            bindparam('keys', keys, type_=ARRAY(self.column.type))))
+
+        try:
+            # loaders of one session take turns, a session runs one query
+            # at a time
+            async with self.lock:
+                result = await self.session.exec(statement)
+            found = {self._normalize(getattr(instance, self.column.key)): instance
+                     for instance in result.all()}
+        except asyncio.CancelledError:
+            self._fail(keys, None)
+            raise
+        except Exception as e:
+            self._fail(keys, e)
+            return
+
+        for key in keys:
+            future = self.cache[key]
+            if not future.done():
+                future.set_result(found.get(key))
+
+    def _fail(self, keys: list, error: Optional[Exception]) -> None:
+        # failed keys are forgotten so a later load retries them
+        for key in keys:
+            future = self.cache.pop(key)
+
+            if future.done():
+                continue
+            if error is None:
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    def _normalize(self, key: Any) -> Any:
+        if not self.is_uuid:
+            return key
+
+        # malformed ids cannot match any row, they are not sent to postgres
+        key = parse_uuid(key)
+        return _MISSING if key is None else key
+
+
+def parse_uuid(value: Any) -> Optional[uuid.UUID]:
+    if isinstance(value, uuid.UUID):
+        return value
+
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def get_loader(session: AsyncSession,
+               model: type,
+               column: InstrumentedAttribute) -> Loader:
+    # loaders live on the session, which is scoped to one request
+    loaders = session.info.setdefault(LOADERS_KEY, {})
+    loader = loaders.get((model, column.key))
+
+    if loader is None:
+        lock = session.info.setdefault(LOADERS_LOCK_KEY, asyncio.Lock())
+        loader = loaders[(model, column.key)] = Loader(
+            session, model, column, lock)
+
+    return loader
+
+
+async def load_one(session: AsyncSession,
+                   model: type,
+                   column: InstrumentedAttribute,
+                   key: Any) -> Optional[Any]:
+    return await get_loader(session, model, column).load(key)
+
+
+# cached rows are only trusted within the transaction that loaded them
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def clear_loaders(session: Session) -> None:
+    for loader in session.info.get(LOADERS_KEY, {}).values():
+        loader.clear()
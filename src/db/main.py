@@ -1,33 +1,196 @@
-from sqlmodel import create_engine, SQLModel
+from sqlmodel import create_engine
 from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy import exc, event
+from sqlalchemy.orm import Session
+from fastapi import Request
 from src.config import Config
+from src.timing import instrument_engine
 from sqlmodel.ext.asyncio.session import AsyncSession
 from typing import AsyncGenerator
 from sqlalchemy.orm import sessionmaker
+import itertools
+import time
+from http.cookies import SimpleCookie
 
 
-async_engine = AsyncEngine(
-    create_engine(
-        url=Config.DATABASE_URL
-    )
-)
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    A queue pool that records how long checkouts wait for a connection.
+    """
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
 
-async def init_db() -> None:
-    async with async_engine.begin() as conn:
-        from src.db.models import Book, User
+    def _do_get(self):
+        started_at = time.perf_counter()
+
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+
+    def stats(self) -> dict:
+        return {
+            'size': self.size(),
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            'overflow': max(0, self.overflow()),
+            'max_overflow': self._max_overflow,
+            'checkouts': self.checkouts,
+            'timeouts': self.timeouts,
+            'wait_time_avg_ms': (self.wait_time_total / self.checkouts * 1000
+                                 if self.checkouts else 0.0),
+            'wait_time_max_ms': self.wait_time_max * 1000
+        }
+
+
+# browsers keep the cookie, api clients without a cookie jar can echo the
+# header of the same name back instead
+PRIMARY_STICKY_COOKIE = 'bookly_primary_until'
+PRIMARY_STICKY_HEADER = 'x-bookly-primary-until'
 
-        await conn.run_sync(
-            SQLModel.metadata.create_all,
-            tables=[Book.__tablename__, User.__tablename__]
+
+def build_engine(url: str) -> AsyncEngine:
+    engine = AsyncEngine(
+        create_engine(
+            url=url,
+            poolclass=InstrumentedPool,
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT,
+            pool_recycle=Config.DB_POOL_RECYCLE,
+            pool_pre_ping=Config.DB_POOL_PRE_PING
         )
+    )
+    instrument_engine(engine)
+    return engine
 
 
-async def get_session() -> AsyncGenerator[AsyncSession, None]:
-    Session = sessionmaker(
-        bind=async_engine,
+def build_session_maker(engine: AsyncEngine) -> sessionmaker:
+    return sessionmaker(
+        bind=engine,
         class_=AsyncSession,
-        expire_on_commit=False)
+        expire_on_commit=False
+    )
+
+
+async_engine = build_engine(Config.DATABASE_URL)
+
+# the session factory is built once and shared by every request
+async_session_maker = build_session_maker(async_engine)
 
-    async with Session() as session:
+# read replicas are used round robin by get_read_session
+replica_engines = [
+    build_engine(url.strip())
+    for url in Config.DATABASE_REPLICA_URLS.split(',') if url.strip()
+]
+replica_session_makers = itertools.cycle(
+    [build_session_maker(engine) for engine in replica_engines])
+
+
+async def init_db() -> None:
+    # the schema is owned by the alembic migrations, startup only verifies it
+    if not Config.SCHEMA_CHECK_ON_STARTUP:
+        return
+
+    from src.db.schema import check_schema
+
+    async with async_engine.connect() as conn:
+        await conn.run_sync(check_schema)
+
+
+def get_pool_stats() -> dict:
+    return {
+        'primary': async_engine.pool.stats(),
+        'replicas': [engine.pool.stats() for engine in replica_engines]
+    }
+
+
+async def get_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_maker() as session:
+        # a committed write flags the request, PrimaryStickyMiddleware then
+        # pins this client's reads to the primary whatever response is sent
+        session.info['request_state'] = request.state
         yield session
+
+
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with get_read_session_maker(request)() as session:
+        yield session
+
+
+def get_read_session_maker(request: Request) -> sessionmaker:
+    if replica_engines and not is_primary_sticky(request):
+        return next(replica_session_makers)
+
+    return async_session_maker
+
+
+def is_primary_sticky(request: Request) -> bool:
+    sticky_until = (request.cookies.get(PRIMARY_STICKY_COOKIE)
+                    or request.headers.get(PRIMARY_STICKY_HEADER))
+
+    if sticky_until is None:
+        return False
+
+    try:
+        sticky_until = float(sticky_until)
+    except ValueError:
+        return False
+
+    # the value comes from the client, one further ahead than we ever set
+    # would pin its reads to the primary for as long as it likes
+    now = time.time()
+    return now < sticky_until <= now + Config.REPLICA_STICKY_SECONDS
+
+
+# track writes made through a session, both flushes and bulk statements
+@event.listens_for(Session, 'after_flush')
+def mark_flush_write(session: Session, flush_context) -> None:
+    session.info['has_writes'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def mark_statement_write(orm_execute_state) -> None:
+    if (orm_execute_state.is_insert or orm_execute_state.is_update
+            or orm_execute_state.is_delete):
+        orm_execute_state.session.info['has_writes'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def stick_to_primary(session: Session) -> None:
+    request_state = session.info.get('request_state')
+
+    if session.info.pop('has_writes', False) and replica_engines and request_state:
+        request_state.stick_to_primary = True
+
+
+def primary_sticky_headers() -> list:
+    sticky_until = str(time.time() + Config.REPLICA_STICKY_SECONDS)
+
+    cookie = SimpleCookie()
+    cookie[PRIMARY_STICKY_COOKIE] = sticky_until
+    cookie[PRIMARY_STICKY_COOKIE]['max-age'] = Config.REPLICA_STICKY_SECONDS
+    cookie[PRIMARY_STICKY_COOKIE]['path'] = '/'
+    cookie[PRIMARY_STICKY_COOKIE]['httponly'] = True
+
+    return [
+        (b'set-cookie', cookie.output(header='').strip().encode()),
+        (PRIMARY_STICKY_HEADER.encode(), sticky_until.encode())
+    ]
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_writes(session: Session) -> None:
+    session.info.pop('has_writes', None)
@@ -1,14 +1,20 @@
 from sqlmodel import SQLModel, Field, Column, Relationship
+from sqlalchemy import Index
 from datetime import datetime, date
 import uuid
 import sqlalchemy.dialects.postgresql as pg
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class User(SQLModel, table=True):
 
     __tablename__ = "users"
 
+    # users are looked up by email on login and signup
+    __table_args__ = (
+        Index('ix_users_email', 'email', unique=True),
+    )
+
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID(as_uuid=True),
@@ -45,11 +51,15 @@ class User(SQLModel, table=True):
             onupdate=datetime.now
         )
     )
+    # relationships are never loaded implicitly, the services ask for them,
+    # and deletes leave the foreign keys to postgres
     books: List['Book'] = Relationship(
-        back_populates='user', sa_relationship_kwargs={'lazy': 'selectin'}
+        back_populates='user',
+        sa_relationship_kwargs={'lazy': 'raise', 'passive_deletes': True}
     )
     reviews: List['Review'] = Relationship(
-        back_populates='user', sa_relationship_kwargs={'lazy': 'selectin'}
+        back_populates='user',
+        sa_relationship_kwargs={'lazy': 'raise', 'passive_deletes': True}
     )
 
     def __repr__(self):
@@ -61,6 +71,14 @@ class Book(SQLModel, table=True):
     # table name in the database
     __tablename__ = "books"
 
+    # indexes backing the keyset pagination on (created_at, uid), their
+    # leading columns also serve plain lookups by user_uid and created_at
+    __table_args__ = (
+        Index('ix_books_created_at_uid', 'created_at', 'uid'),
+        Index('ix_books_user_uid_created_at_uid',
+              'user_uid', 'created_at', 'uid'),
+    )
+
     # define the columns of the table
 
     # creating an id field as postgresql UUID
@@ -81,7 +99,36 @@ class Book(SQLModel, table=True):
     language: str
     user_uid: Optional[uuid.UUID] = Field(
         default=None,
-        foreign_key='users.uid'
+        foreign_key='users.uid',
+        ondelete='SET NULL'
+    )
+    # rating aggregates kept up to date by the review service, so ratings
+    # can be shown without reading the reviews
+    review_count: int = Field(
+        default=0,
+        sa_column=Column(
+            pg.INTEGER,
+            nullable=False,
+            default=0,
+            server_default='0'
+        )
+    )
+    rating_sum: int = Field(
+        default=0,
+        sa_column=Column(
+            pg.INTEGER,
+            nullable=False,
+            default=0,
+            server_default='0'
+        )
+    )
+    rating_histogram: Dict[str, int] = Field(
+        default_factory=dict,
+        sa_column=Column(
+            pg.JSONB,
+            nullable=False,
+            server_default='{}'
+        )
     )
     created_at: datetime = Field(
         sa_column=Column(
@@ -98,7 +145,8 @@ class Book(SQLModel, table=True):
     )
     user: Optional[User] = Relationship(back_populates="books")
     reviews: List['Review'] = Relationship(
-        back_populates='book', sa_relationship_kwargs={'lazy': 'selectin'}
+        back_populates='book',
+        sa_relationship_kwargs={'lazy': 'raise', 'passive_deletes': True}
     )
 
     def __repr__(self):
@@ -108,6 +156,12 @@ class Book(SQLModel, table=True):
 class Review(SQLModel, table=True):
     __tablename__ = "reviews"
 
+    __table_args__ = (
+        Index('ix_reviews_book_uid', 'book_uid'),
+        Index('ix_reviews_user_uid', 'user_uid'),
+        Index('ix_reviews_created_at', 'created_at'),
+    )
+
     uid: uuid.UUID = Field(
         sa_column=Column(
             pg.UUID(as_uuid=True),
@@ -120,11 +174,13 @@ class Review(SQLModel, table=True):
     review_text: str
     user_uid: Optional[uuid.UUID] = Field(
         default=None,
-        foreign_key='users.uid'
+        foreign_key='users.uid',
+        ondelete='SET NULL'
     )
     book_uid: Optional[uuid.UUID] = Field(
         default=None,
-        foreign_key='books.uid'
+        foreign_key='books.uid',
+        ondelete='SET NULL'
     )
     created_at: datetime = Field(
         sa_column=Column(
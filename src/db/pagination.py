@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+from src.errors import InvalidCursor
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _encode_value(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(values: List[Any]) -> str:
+    # the cursor is opaque to clients, it only carries the sort key of the last row
+    payload = json.dumps(values, default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError):
+        raise InvalidCursor()
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor()
+
+    return values
@@ -1,17 +1,230 @@
+import asyncio
+import logging
+import time
 import redis.asyncio as aioredis
 from src.config import Config
+from src.db.bloom import BloomFilter
+from src.db.breaker import CircuitBreaker
+from src.errors import ServiceUnavailable
+from src.metrics import redis_command_duration
+from src.timing import current_timing
 
 JTI_EXPIRY = 3600
+JTI_BLOCKLIST_KEY = 'jti_blocklist'
+JTI_REVOKED_CHANNEL = 'jti_revoked'
+ROLE_VERSION_PREFIX = 'role_version:'
 
-token_blocklist = aioredis.from_url(
+
+def record_redis_time(command: str, started_at: float) -> None:
+    elapsed = time.perf_counter() - started_at
+    redis_command_duration.observe((command,), elapsed)
+
+    timing = current_timing()
+    if timing is not None:
+        timing.add('redis', elapsed)
+
+
+class InstrumentedPipeline(aioredis.client.Pipeline):
+    """
+    A pipeline that records how long each round trip to redis takes.
+    """
+
+    async def execute(self, raise_on_error: bool = True):
+        started_at = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            record_redis_time('PIPELINE', started_at)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """
+    A redis client that records the latency of every command.
+    """
+
+    async def execute_command(self, *args, **options):
+        started_at = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_redis_time(str(args[0]).upper(), started_at)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+redis_client = InstrumentedRedis.from_url(
     Config.REDIS_URL,
     decode_responses=True
 )
 
 
+class BlocklistFilter:
+    """
+    In-process bloom filter of revoked token ids.
+
+    A miss means the token was never revoked, so redis is skipped. The
+    filter is only trusted while the sync task keeps it up to date.
+    """
+
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.ready = False
+        self.skipped_lookups = 0
+
+    def add(self, jti: str) -> None:
+        self.bloom.add(jti)
+
+    def might_contain(self, jti: str) -> bool:
+        if not self.ready:
+            return True
+
+        if jti in self.bloom:
+            return True
+
+        self.skipped_lookups += 1
+        return False
+
+    async def rebuild(self) -> None:
+        # bloom filters cannot forget, so expired ids are dropped by
+        # rebuilding from the sorted set of live revocations
+        now = time.time()
+        await redis_client.zremrangebyscore(JTI_BLOCKLIST_KEY, '-inf', now)
+        revoked = await redis_client.zrangebyscore(
+            JTI_BLOCKLIST_KEY, now, '+inf')
+
+        bloom = BloomFilter(max(self.capacity, len(revoked)), self.error_rate)
+        for jti in revoked:
+            bloom.add(jti)
+
+        self.bloom = bloom
+        self.ready = True
+
+    def stats(self) -> dict:
+        return {
+            'ready': self.ready,
+            'size': self.bloom.count,
+            'skipped_lookups': self.skipped_lookups
+        }
+
+
+# create the revoked token filter and the breaker guarding redis lookups
+blocklist_filter = BlocklistFilter(
+    capacity=Config.JTI_FILTER_CAPACITY,
+    error_rate=Config.JTI_FILTER_ERROR_RATE
+)
+blocklist_breaker = CircuitBreaker(
+    failure_threshold=Config.REDIS_BREAKER_FAILURES,
+    reset_timeout=Config.REDIS_BREAKER_RESET_SECONDS
+)
+
+
 async def add_jti_to_blocklist(jti: str) -> None:
-    await token_blocklist.set(name=jti, value=1, ex=JTI_EXPIRY)
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.set(name=jti, value=1, ex=JTI_EXPIRY)
+        pipe.zadd(JTI_BLOCKLIST_KEY, {jti: time.time() + JTI_EXPIRY})
+        pipe.publish(JTI_REVOKED_CHANNEL, jti)
+        await pipe.execute()
+
+    blocklist_filter.add(jti)
 
 
 async def check_jti_in_blocklist(jti: str) -> bool:
-    return await token_blocklist.exists(jti) > 0
+    if Config.JTI_FILTER_ENABLED and not blocklist_filter.might_contain(jti):
+        return False
+
+    if not blocklist_breaker.allow_request():
+        return blocklist_unavailable(jti)
+
+    try:
+        exists = await asyncio.wait_for(
+            redis_client.exists(jti),
+            timeout=Config.JTI_BLOCKLIST_TIMEOUT
+        )
+    except (aioredis.RedisError, OSError, asyncio.TimeoutError) as e:
+        logging.warning(f"Token blocklist lookup failed: {e!r}")
+        blocklist_breaker.record_failure()
+        return blocklist_unavailable(jti)
+
+    blocklist_breaker.record_success()
+    return exists > 0
+
+
+def blocklist_unavailable(jti: str) -> bool:
+    if not Config.JTI_BLOCKLIST_FAIL_OPEN:
+        raise ServiceUnavailable()
+
+    # failing open still rejects every id the local filter knows about
+    return blocklist_filter.ready and jti in blocklist_filter.bloom
+
+
+async def sync_blocklist_filter() -> None:
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            async with redis_client.pubsub() as pubsub:
+                # subscribe before the snapshot so no revocation is missed
+                await pubsub.subscribe(JTI_REVOKED_CHANNEL)
+
+                while True:
+                    await blocklist_filter.rebuild()
+                    resync_at = loop.time() + Config.JTI_FILTER_RESYNC_SECONDS
+
+                    while loop.time() < resync_at:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True,
+                            timeout=1.0
+                        )
+
+                        if message is not None:
+                            blocklist_filter.add(message['data'])
+        except asyncio.CancelledError:
+            blocklist_filter.ready = False
+            raise
+        except Exception as e:
+            blocklist_filter.ready = False
+            logging.warning(f"Token blocklist sync failed: {e!r}")
+            await asyncio.sleep(1)
+
+
+async def get_role_version(user_uid: str) -> int | None:
+    # a missing version is unknown, not 0: it may have been lost with a
+    # flush or failover, so no token claim can be trusted against it
+    version = await redis_client.get(ROLE_VERSION_PREFIX + user_uid)
+    return int(version) if version else None
+
+
+async def ensure_role_version(user_uid: str) -> int:
+    # new versions come from the clock, so a version lost with redis is
+    # never handed out again and older tokens keep failing the check
+    key = ROLE_VERSION_PREFIX + user_uid
+
+    async with redis_client.pipeline(transaction=True) as pipe:
+        pipe.set(key, time.time_ns() // 1000, nx=True)
+        pipe.get(key)
+        _, version = await pipe.execute()
+
+    return int(version)
+
+
+async def reset_role_version(user_uid: str) -> None:
+    # tokens of the user fall back to the database until the next login
+    # issues a new version
+    await redis_client.delete(ROLE_VERSION_PREFIX + user_uid)
+
+
+async def get_cached_value(key: str) -> str | None:
+    return await redis_client.get(key)
+
+
+async def set_cached_value(key: str, value: str, expiry: int) -> None:
+    await redis_client.set(name=key, value=value, ex=expiry)
+
+
+async def delete_cached_value(key: str) -> None:
+    await redis_client.delete(key)
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+from pathlib import Path
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy.engine import Connection
+from sqlmodel import SQLModel
+
+MIGRATIONS_DIR = Path(__file__).resolve().parents[2] / 'migrations'
+
+# maintained by postgres and the migrations, not declared on the models
+UNMODELED_OBJECTS = {
+    ('column', 'search_vector'),
+    ('index', 'ix_books_search_vector'),
+}
+
+
+class SchemaDriftError(RuntimeError):
+    """The live database schema does not match the models"""
+    pass
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    return not (reflected and (type_, name) in UNMODELED_OBJECTS)
+
+
+def get_schema_drift(connection: Connection) -> list:
+    import src.db.models  # noqa: F401, registers the tables on the metadata
+
+    context = MigrationContext.configure(
+        connection,
+        opts={'include_object': include_object, 'compare_type': True}
+    )
+    drift = []
+
+    head = ScriptDirectory(str(MIGRATIONS_DIR)).get_current_head()
+    current = context.get_current_revision()
+    if current != head:
+        drift.append(f'database is at revision {current}, migrations head is {head}')
+
+    drift.extend(
+        repr(diff) for diff in compare_metadata(context, SQLModel.metadata))
+    return drift
+
+
+def check_schema(connection: Connection) -> None:
+    drift = get_schema_drift(connection)
+
+    if drift:
+        raise SchemaDriftError(
+            'Database schema has drifted from the models, run '
+            '`alembic upgrade head` or add a migration:\n  '
+            + '\n  '.join(drift)
+        )
+
+
+async def main() -> int:
+    from src.db.main import async_engine
+
+    try:
+        async with async_engine.connect() as conn:
+            await conn.run_sync(check_schema)
+    except SchemaDriftError as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        await async_engine.dispose()
+
+    print('Database schema matches the models')
+    return 0
+
+
+# python -m src.db.schema, exits non-zero when the schema has drifted
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
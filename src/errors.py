@@ -80,6 +80,20 @@ class ReviewNotFound(BooklyException):
     pass
 
 
+class InvalidCursor(BooklyException):
+    """
+    Raised when the provided pagination cursor is malformed.
+    """
+    pass
+
+
+class ServiceUnavailable(BooklyException):
+    """
+    Raised when a backing service is unavailable and the request cannot be served safely.
+    """
+    pass
+
+
 def create_exception_handler(status_code: int, initial_detail: Any) -> Callable[[Request, Exception], JSONResponse]:
     async def exception_handler(request: Request, exc: BooklyException):
         return JSONResponse(
@@ -203,3 +217,27 @@ def register_all_exceptions(app: FastAPI):
             }
         )
     )
+
+    app.add_exception_handler(
+        InvalidCursor,
+        create_exception_handler(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            initial_detail={
+                "message": "Invalid pagination cursor",
+                "resolution": "Use the next_cursor value returned by the previous page",
+                "error_code": "invalid_cursor"
+            }
+        )
+    )
+
+    app.add_exception_handler(
+        ServiceUnavailable,
+        create_exception_handler(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            initial_detail={
+                "message": "Service temporarily unavailable",
+                "resolution": "Please try again later",
+                "error_code": "service_unavailable"
+            }
+        )
+    )
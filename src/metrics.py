@@ -0,0 +1,469 @@
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import orjson
+from src.config import Config
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+AGGREGATE_FILE = 'aggregate.json'
+LOCK_FILE = '.lock'
+METRICS_DIR_PREFIX = 'bookly-metrics-'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75,
+                   1.0, 2.5, 5.0, 7.5, 10.0)
+REDIS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                         0.1, 0.25, 0.5, 1.0)
+
+
+# metrics are only touched from the event loop thread of their worker, so
+# updates are plain dict and list operations without any locking
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list:
+        return [[list(labels), value] for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def set(self, labels: tuple, value: float) -> None:
+        self.values[labels] = value
+
+
+class CollectedMetric:
+    """
+    A gauge or counter owned by another component, read from a callback
+    returning (labels, value) pairs when the metrics are collected.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str],
+                 callback: Callable[[], Iterable[Tuple[tuple, float]]],
+                 type: str = 'gauge') -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.type = type
+
+    def samples(self) -> list:
+        try:
+            return [[list(labels), value] for labels, value in self.callback()]
+        except Exception as e:
+            logging.warning(f"Collecting {self.name} failed: {e!r}")
+            return []
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> per bucket counts, the last one for +Inf, then the sum
+        self.values = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        counts = self.values.get(labels)
+
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def samples(self) -> list:
+        return [[list(labels), list(counts)]
+                for labels, counts in self.values.items()]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def snapshot(self) -> dict:
+        return {
+            metric.name: {
+                'type': metric.type,
+                'help': metric.help,
+                'labelnames': list(metric.labelnames),
+                'buckets': list(getattr(metric, 'buckets', ())),
+                'samples': metric.samples()
+            }
+            for metric in self.metrics
+        }
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def process_start(pid: int) -> str:
+    # tells a reused pid apart from the process that had it before, where
+    # /proc is available
+    try:
+        with open(f'/proc/{pid}/stat') as stat:
+            return stat.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ''
+
+
+def get_metrics_dir_owner() -> int:
+    """
+    The process whose workers share the default metrics directory.
+
+    uvicorn and gunicorn workers share their master. A process started
+    directly by init, under docker or systemd, has no master to go by and
+    keeps a directory of its own, workers of a master running as pid 1
+    need METRICS_DIR to be shared.
+    """
+    master_pid = os.getppid()
+
+    if master_pid > 1:
+        return master_pid
+
+    if master_pid == 1 and os.getpid() != 1:
+        logging.warning(
+            "The metrics of this process are not shared with other workers, "
+            "set METRICS_DIR when running several workers under pid 1")
+
+    return os.getpid()
+
+
+def default_metrics_dir(owner: int) -> str:
+    # every server gets its own directory, so deployments on one host never
+    # mix and a restarted server starts from zero
+    name = '-'.join(filter(None, (str(owner), process_start(owner))))
+    return os.path.join(tempfile.gettempdir(), METRICS_DIR_PREFIX + name)
+
+
+def remove_dead_metrics_dirs() -> None:
+    # default directories of servers that are no longer running
+    for path in Path(tempfile.gettempdir()).glob(f'{METRICS_DIR_PREFIX}*'):
+        owner, _, started = path.name.removeprefix(METRICS_DIR_PREFIX).partition('-')
+
+        try:
+            owner = int(owner)
+        except ValueError:
+            continue
+
+        if not pid_alive(owner) or (started and started != process_start(owner)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class SnapshotStore:
+    """
+    Shares metrics between uvicorn workers through one snapshot file per
+    process in a common directory.
+
+    Counters and histograms of every file are summed, gauges only count
+    while their file is fresh. The files of workers that have exited are
+    folded into a single aggregate file, so their totals are kept without
+    the directory growing with every restart.
+    """
+
+    def __init__(self, directory: str, stale_seconds: float) -> None:
+        self.directory = Path(directory)
+        self.stale_seconds = stale_seconds
+        self.aggregate_path = self.directory / AGGREGATE_FILE
+        # a new process reusing the pid of a dead worker never overwrites
+        # the totals of that worker
+        self.path = self.directory / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json'
+
+    def write(self, snapshot: dict) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write_file(self.path, snapshot)
+
+    def read_all(self) -> List[Tuple[dict, bool]]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # workers scraped at the same time take turns, so a dead worker is
+        # folded once and never counted twice
+        with open(self.directory / LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = self._read_files()
+            dead = [path for path, _, fresh in snapshots
+                    if not fresh and self._is_dead(path)]
+
+            if dead:
+                self._fold(snapshots, dead)
+                snapshots = self._read_files()
+
+        return [(snapshot, fresh and path != self.aggregate_path)
+                for path, snapshot, fresh in snapshots]
+
+    def _read_files(self) -> List[Tuple[Path, dict, bool]]:
+        now = time.time()
+        snapshots = []
+
+        for path in self.directory.glob('*.json'):
+            try:
+                snapshot = orjson.loads(path.read_bytes())
+                fresh = now - path.stat().st_mtime <= self.stale_seconds
+            except (OSError, orjson.JSONDecodeError):
+                continue
+            snapshots.append((path, snapshot, fresh or path == self.path))
+
+        return snapshots
+
+    def _is_dead(self, path: Path) -> bool:
+        if path == self.aggregate_path:
+            return False
+
+        try:
+            pid = int(path.stem.split('-', 1)[0])
+        except ValueError:
+            return False
+
+        # the pid is gone, or another file shows it was taken by a newer
+        # worker
+        return (not pid_alive(pid)
+                or len(list(self.directory.glob(f'{pid}-*.json'))) > 1)
+
+    def _fold(self, snapshots: List[Tuple[Path, dict, bool]], dead: List[Path]) -> None:
+        # gauges of the dead workers are dropped, their totals are kept
+        merged = merge_snapshots([(snapshot, False) for path, snapshot, _ in snapshots
+                                  if path in dead or path == self.aggregate_path])
+        self._write_file(self.aggregate_path, {
+            name: {**metric, 'samples': [[list(labels), value] for labels, value
+                                         in metric['samples'].items()]}
+            for name, metric in merged.items()
+        })
+
+        for path in dead:
+            path.unlink(missing_ok=True)
+
+    def _write_file(self, path: Path, snapshot: dict) -> None:
+        temp_path = path.with_suffix('.tmp')
+        temp_path.write_bytes(orjson.dumps(snapshot))
+        os.replace(temp_path, path)
+
+
+def merge_snapshots(snapshots: List[Tuple[dict, bool]]) -> dict:
+    merged = {}
+
+    for snapshot, fresh in snapshots:
+        for name, metric in snapshot.items():
+            if metric['type'] == 'gauge' and not fresh:
+                continue
+
+            target = merged.setdefault(name, {**metric, 'samples': {}})
+
+            for labels, value in metric['samples']:
+                labels = tuple(labels)
+                current = target['samples'].get(labels)
+
+                if current is None:
+                    target['samples'][labels] = value
+                elif metric['type'] == 'histogram':
+                    target['samples'][labels] = [a + b for a, b in zip(current, value)]
+                else:
+                    target['samples'][labels] = current + value
+
+    return merged
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames: Sequence[str], labels: Sequence, extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(labelnames, labels)) + list((extra or {}).items())
+
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def render(merged: dict) -> str:
+    lines = []
+
+    for name, metric in merged.items():
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        labelnames = metric['labelnames']
+
+        for labels, value in sorted(metric['samples'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_format_labels(labelnames, labels)} {value}')
+                continue
+
+            *counts, total = value
+            cumulative = 0
+            for bound, count in zip([*metric['buckets'], '+Inf'], counts):
+                cumulative += count
+                le = {'le': bound if bound == '+Inf' else repr(float(bound))}
+                lines.append(
+                    f'{name}_bucket{_format_labels(labelnames, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labelnames, labels)} {total}')
+            lines.append(f'{name}_count{_format_labels(labelnames, labels)} {cumulative}')
+
+    return '\n'.join(lines) + '\n'
+
+
+# create the registry and the metrics recorded on the hot paths
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    'bookly_http_requests_total',
+    'HTTP requests by method, route template and status code',
+    ('method', 'route', 'status')
+))
+http_request_duration = registry.register(Histogram(
+    'bookly_http_request_duration_seconds',
+    'HTTP request latency by method and route template',
+    ('method', 'route')
+))
+http_in_flight = registry.register(Gauge(
+    'bookly_http_requests_in_flight',
+    'HTTP requests currently being served'
+))
+redis_command_duration = registry.register(Histogram(
+    'bookly_redis_command_duration_seconds',
+    'Latency of redis commands and pipelines',
+    ('command',),
+    buckets=REDIS_LATENCY_BUCKETS
+))
+
+
+def _pool_connections():
+    from src.db.main import get_pool_stats
+
+    stats = get_pool_stats()
+    pools = [('primary', stats['primary'])] + [
+        (f'replica{index}', replica) for index, replica in enumerate(stats['replicas'])]
+
+    for pool, pool_stats in pools:
+        for state in ('size', 'checked_in', 'checked_out', 'overflow'):
+            yield (pool, state), pool_stats[state]
+
+
+def _pool_counter(name: str):
+    def collect():
+        from src.db.main import get_pool_stats
+
+        stats = get_pool_stats()
+        yield ('primary',), stats['primary'][name]
+        for index, replica in enumerate(stats['replicas']):
+            yield (f'replica{index}',), replica[name]
+
+    return collect
+
+
+def _password_hashing(name: str):
+    def collect():
+        from src.auth.utils import password_hasher
+
+        yield (), password_hasher.stats()[name]
+
+    return collect
+
+
+registry.register(CollectedMetric(
+    'bookly_db_pool_connections',
+    'Connections of the database pools by state',
+    ('pool', 'state'),
+    _pool_connections
+))
+registry.register(CollectedMetric(
+    'bookly_db_pool_checkouts_total',
+    'Connection checkouts from the database pools',
+    ('pool',),
+    _pool_counter('checkouts'),
+    type='counter'
+))
+registry.register(CollectedMetric(
+    'bookly_db_pool_timeouts_total',
+    'Connection checkouts that timed out waiting for the database pools',
+    ('pool',),
+    _pool_counter('timeouts'),
+    type='counter'
+))
+registry.register(CollectedMetric(
+    'bookly_password_hash_queue_depth',
+    'Password hashing jobs waiting for a worker',
+    (),
+    _password_hashing('queue_depth')
+))
+registry.register(CollectedMetric(
+    'bookly_password_hash_in_flight',
+    'Password hashing jobs queued or running',
+    (),
+    _password_hashing('in_flight')
+))
+registry.register(CollectedMetric(
+    'bookly_password_hash_rejected_total',
+    'Password hashing jobs rejected because the pool was saturated',
+    (),
+    _password_hashing('rejected'),
+    type='counter'
+))
+
+metrics_dir_owner = None if Config.METRICS_DIR else get_metrics_dir_owner()
+
+snapshot_store = SnapshotStore(
+    directory=Config.METRICS_DIR or default_metrics_dir(metrics_dir_owner),
+    stale_seconds=Config.METRICS_FLUSH_SECONDS * 3
+)
+
+
+async def flush_metrics() -> None:
+    if not Config.METRICS_DIR:
+        await asyncio.to_thread(remove_dead_metrics_dirs)
+
+        # a directory of this process alone holds nothing worth keeping
+        if metrics_dir_owner == os.getpid():
+            await asyncio.to_thread(
+                shutil.rmtree, snapshot_store.directory, ignore_errors=True)
+
+    # the snapshot is taken on the loop, the file is written off it
+    while True:
+        await asyncio.sleep(Config.METRICS_FLUSH_SECONDS)
+
+        try:
+            await asyncio.to_thread(snapshot_store.write, registry.snapshot())
+        except OSError as e:
+            logging.warning(f"Writing the metrics snapshot failed: {e!r}")
+
+
+async def collect_metrics() -> str:
+    snapshot = registry.snapshot()
+
+    def write_and_read():
+        snapshot_store.write(snapshot)
+        return snapshot_store.read_all()
+
+    snapshots = await asyncio.to_thread(write_and_read)
+    return render(merge_snapshots(snapshots))
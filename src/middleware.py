@@ -1,8 +1,19 @@
 from fastapi import FastAPI, status
-from fastapi.requests import Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Sequence
+from src.config import Config
+from src.access_log import access_log
+from src.metrics import http_requests, http_request_duration, http_in_flight
+from src.timing import request_timing
+from src.db.main import (
+    PRIMARY_STICKY_HEADER,
+    primary_sticky_headers,
+    replica_engines
+)
 import time
 import logging
 
@@ -10,39 +21,198 @@ import logging
 logger = logging.getLogger('uvicorn.access')
 logger.disabled = True
 
+
+# the middleware below are plain ASGI callables, unlike @app.middleware('http')
+# they add no extra task per request and pass streaming bodies straight through
+class AccessLogMiddleware:
+    """
+    Hands every request with its status code and duration to the access log.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter_ns()
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            access_log.record(
+                scope, status_code, time.perf_counter_ns() - start_time)
+
+
+class MetricsMiddleware:
+    """
+    Counts requests and records their latency by route template, so the
+    label values stay bounded whatever paths are requested.
+
+    Paths that match no route at all are labelled 'unmatched'.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Sequence[BaseRoute] = ()) -> None:
+        self.app = app
+        self.routes = routes
+
+    def route_template(self, scope: Scope) -> str:
+        route = scope.get('route')
+
+        # only api routes store themselves in the scope, requests answered
+        # before routing, like the auth precheck's 401s, and plain routes
+        # such as /docs are matched here
+        if route is None:
+            for candidate in self.routes:
+                match, _ = candidate.matches(scope)
+                if match != Match.NONE:
+                    route = candidate
+                    break
+
+        return getattr(route, 'path', None) or 'unmatched'
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        http_in_flight.inc()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = self.route_template(scope)
+            method = scope['method']
+
+            http_in_flight.inc(amount=-1)
+            http_requests.inc((method, route, str(status_code)))
+            http_request_duration.observe(
+                (method, route), time.perf_counter() - start_time)
+
+
+class ServerTimingMiddleware:
+    """
+    Times the phases of every request, which also watches it for repeated
+    queries, and optionally reports them in the Server-Timing header.
+    """
+
+    def __init__(self, app: ASGIApp, send_header: bool = False) -> None:
+        self.app = app
+        self.send_header = send_header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        with request_timing(scope['path']) as timing:
+
+            async def send_with_timing(message: Message) -> None:
+                if message['type'] == 'http.response.start' and self.send_header:
+                    message['headers'] = [
+                        *message.get('headers', []),
+                        (b'server-timing', timing.server_timing().encode())
+                    ]
+                await send(message)
+
+            await self.app(scope, receive, send_with_timing)
+
+
+class PrimaryStickyMiddleware:
+    """
+    Pins the client's reads to the primary after a request committed a
+    write, by adding the sticky cookie and header to whatever response the
+    endpoint returns.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        # request.state of the endpoint is backed by this dict
+        state = scope.setdefault('state', {})
+
+        async def send_with_sticky(message: Message) -> None:
+            if message['type'] == 'http.response.start' and state.get('stick_to_primary'):
+                message['headers'] = [
+                    *message.get('headers', []),
+                    *primary_sticky_headers()
+                ]
+            await send(message)
+
+        await self.app(scope, receive, send_with_sticky)
+
+
+class AuthorizationHeaderMiddleware:
+    """
+    Rejects requests without an Authorization header before they reach
+    the routes, except for the exempt path prefixes.
+    """
+
+    def __init__(self, app: ASGIApp, exempt_prefixes: Sequence[str] = ()) -> None:
+        self.app = app
+        self.exempt_prefixes = tuple(exempt_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (scope['type'] != 'http'
+                or scope['path'].startswith(self.exempt_prefixes)
+                or any(name == b'authorization' for name, _ in scope['headers'])):
+            await self.app(scope, receive, send)
+            return
+
+        response = JSONResponse(
+            content={
+                'message': 'Not Authenticated',
+                'resolution': 'Please provide the right credentials to proceed'
+            },
+            status_code=status.HTTP_401_UNAUTHORIZED
+        )
+        await response(scope, receive, send)
+
+
 def register_middleware(app: FastAPI):
 
-    # creating a http middleware
-    @app.middleware('http')
-    async def custom_logging(request: Request, call_next):
-        start_time = time.time()
-        response = await call_next(request)
-        end_time = time.time() - start_time
-
-        message = f"{request.client.host}:{request.client.port} - {request.method} - {request.url.path} - {response.status_code} completed after {end_time}s"
-        print(message)
-        return response
-
-    @app.middleware('http')
-    async def check_authorization_header(request: Request, call_next):
-        if not 'Authorization' in request.headers:
-            return JSONResponse(
-                content={
-                    'message': 'Not Authenticated',
-                    'resolution': 'Please provide the right credentials to proceed'
-                },
-                status_code=status.HTTP_401_UNAUTHORIZED
-            )
-
-        response = await call_next()
-        return response
+    # the last middleware added runs first
+    if replica_engines:
+        app.add_middleware(PrimaryStickyMiddleware)
+
+    app.add_middleware(
+        AuthorizationHeaderMiddleware,
+        exempt_prefixes=[
+            prefix.strip()
+            for prefix in Config.AUTH_EXEMPT_PATH_PREFIXES.split(',')
+            if prefix.strip()
+        ]
+    )
 
     app.add_middleware(
         CORSMiddleware,
         allow_origins=['*'],
         allow_methods=['*'],
         allow_headers=['*'],
-        allow_credentials=True
+        allow_credentials=True,
+        expose_headers=[PRIMARY_STICKY_HEADER]
     )
 
     app.add_middleware(
@@ -50,4 +220,16 @@ def register_middleware(app: FastAPI):
         allowed_hosts=['localhost', '127.0.0.1', '0.0.0.0']
     )
 
+    app.add_middleware(
+        ServerTimingMiddleware,
+        send_header=Config.SERVER_TIMING_ENABLED
+    )
+
+    # outermost, so requests rejected by the other middleware are measured
+    # and logged too
+    if Config.METRICS_ENABLED:
+        # the list is filled by include_router after this
+        app.add_middleware(MetricsMiddleware, routes=app.router.routes)
 
+    if Config.ACCESS_LOG_ENABLED:
+        app.add_middleware(AccessLogMiddleware)
@@ -0,0 +1,193 @@
+import csv
+import io
+import types
+import typing
+import orjson
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, AsyncIterator, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import Table, select
+from sqlalchemy.orm import sessionmaker
+from src.timing import timed
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+_MISSING = object()
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    """
+    An ORJSONResponse that counts its encoding towards the serialize phase.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with timed('serialize'):
+            return super().render(content)
+
+
+def _is_schema(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, BaseModel)
+
+
+def _unwrap_optional(annotation: Any) -> Any:
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+
+        if len(args) == 1:
+            return args[0]
+
+    return annotation
+
+
+def _contains_schema(annotation: Any) -> bool:
+    return _is_schema(annotation) or any(
+        _contains_schema(arg) for arg in typing.get_args(annotation))
+
+
+def _nested_schema(annotation: Any) -> Optional[tuple]:
+    # returns (schema, many) for fields holding other response schemas,
+    # (TypeAdapter, None) for any other shape holding them, which is
+    # validated instead of copied
+    annotation = _unwrap_optional(annotation)
+
+    if typing.get_origin(annotation) is list:
+        args = typing.get_args(annotation)
+
+        if args and _is_schema(args[0]):
+            return args[0], True
+
+    if _is_schema(annotation):
+        return annotation, False
+
+    if _contains_schema(annotation):
+        return TypeAdapter(annotation), None
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def field_plan(schema: type[BaseModel]) -> tuple:
+    # computed once per schema, the hot loop only reads attributes; every
+    # entry is (attribute, output key, nested)
+    return tuple(
+        (name, field.serialization_alias or field.alias or name,
+         _nested_schema(field.annotation))
+        for name, field in schema.model_fields.items()
+        if not field.exclude
+    )
+
+
+def dump(schema: type[BaseModel], obj: Any) -> dict:
+    """
+    Extract the fields of a response schema from a trusted object.
+
+    Rows coming from the database already satisfy the schema, so they are
+    not validated again; orjson encodes the uuids and datetimes natively.
+    """
+    # loaded ORM columns live in the instance dict, reading it directly
+    # skips the instrumented attribute descriptors
+    values = obj if isinstance(obj, dict) else obj.__dict__
+    data = {}
+
+    for name, key, nested in field_plan(schema):
+        value = values.get(name, _MISSING)
+
+        if value is _MISSING:
+            value = getattr(obj, name)
+
+        if nested is not None and value is not None:
+            nested_schema, many = nested
+
+            if many is None:
+                value = nested_schema.dump_python(nested_schema.validate_python(
+                    value, from_attributes=True), by_alias=True)
+            elif many:
+                value = dump_many(nested_schema, value)
+            else:
+                value = dump(nested_schema, value)
+
+        data[key] = value
+
+    return data
+
+
+def dump_many(schema: type[BaseModel], rows: Any) -> list:
+    return [dump(schema, row) for row in rows]
+
+
+def schema_response(schema: type[BaseModel],
+                    content: Any,
+                    status_code: int = 200,
+                    headers: Optional[dict] = None) -> TimedORJSONResponse:
+    with timed('serialize'):
+        if isinstance(content, (list, tuple)):
+            data = dump_many(schema, content)
+        else:
+            data = dump(schema, content)
+
+    return TimedORJSONResponse(data, status_code=status_code, headers=headers)
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    return value
+
+
+def _encode_rows(fields: list, rows: list, export_format: str) -> bytes:
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([_csv_value(value) for value in row] for row in rows)
+        return buffer.getvalue().encode()
+
+    return b''.join(orjson.dumps(dict(zip(fields, row))) + b'\n' for row in rows)
+
+
+async def _export_rows(session_maker: sessionmaker,
+                       table: Table,
+                       columns: list,
+                       export_format: str) -> AsyncIterator[bytes]:
+    # the session belongs to the generator, dependencies are already closed
+    # by the time a streaming body is sent
+    statement = select(*[table.c[name] for name, _ in columns]).execution_options(
+        yield_per=EXPORT_BATCH_SIZE)
+    fields = [key for _, key in columns]
+
+    if export_format == 'csv':
+        yield _encode_rows(fields, [fields], export_format)
+
+    async with session_maker() as session:
+        # yield_per streams from a server-side cursor one batch at a time,
+        # the next batch is only fetched once the client took the last one
+        result = await session.stream(statement)
+
+        async for rows in result.partitions():
+            yield _encode_rows(fields, rows, export_format)
+
+
+def export_response(session_maker: sessionmaker,
+                    table: Table,
+                    schema: type[BaseModel],
+                    export_format: str,
+                    filename: str) -> StreamingResponse:
+    columns = [(name, key) for name, key, nested in field_plan(schema) if nested is None]
+
+    return StreamingResponse(
+        _export_rows(session_maker, table, columns, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            'Content-Disposition':
+                f'attachment; filename="{filename}.{export_format}"'
+        }
+    )
@@ -1,12 +1,17 @@
-from fastapi import APIRouter, Depends, status
-from src.db.models import User
+from fastapi import APIRouter, Depends, Query, Request, status
+from src.db.models import User, Review
 from src.reviews.schemas import ReviewCreateSchema, ReviewViewSchema
-from src.db.main import get_session
+from src.db.main import get_session, get_read_session, get_read_session_maker
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.reviews.service import ReviewService
 from src.auth.dependencies import get_current_user, RoleChecker
-from typing import List
+from typing import List, Literal
 from src.errors import ReviewNotFound
+from src.responses import schema_response, export_response
+from src.conditional import (make_etag,
+                             is_not_modified,
+                             not_modified_response,
+                             cache_headers)
 
 # create the router
 review_router = APIRouter()
@@ -22,15 +27,34 @@ user_role_checker = RoleChecker(['user', 'admin'])
 @review_router.get(
     '/',
     response_model=List[ReviewViewSchema],
-    dependencies=[admin_role_checker],
+    dependencies=[Depends(admin_role_checker)],
     status_code=status.HTTP_200_OK,
 )
 async def get_all_reviews(
-        session: AsyncSession = Depends(get_session)
+        session: AsyncSession = Depends(get_read_session)
 ) -> List[ReviewViewSchema]:
     reviews = await review_service.get_all_reviews(session=session)
 
-    return reviews
+    return schema_response(ReviewViewSchema, reviews)
+
+# export every review as ndjson or csv
+@review_router.get(
+    '/export',
+    dependencies=[Depends(admin_role_checker)],
+    status_code=status.HTTP_200_OK,
+)
+async def export_reviews(
+        request: Request,
+        export_format: Literal['ndjson', 'csv'] = Query(
+            default='ndjson', alias='format')
+):
+    return export_response(
+        get_read_session_maker(request),
+        Review.__table__,
+        ReviewViewSchema,
+        export_format,
+        'reviews'
+    )
 
 # get a review by id
 @review_router.get(
@@ -40,14 +64,21 @@ async def get_all_reviews(
 )
 async def get_review_by_id(
         review_id: str,
-        session: AsyncSession = Depends(get_session)
+        request: Request,
+        session: AsyncSession = Depends(get_read_session)
 ) -> ReviewViewSchema:
     review = await review_service.get_review(review_id=review_id, session=session)
 
     if not review:
         raise ReviewNotFound()
 
-    return review
+    # a review has no relationships to load, the row itself is the version
+    etag = make_etag(review.uid, review.updated_at)
+    if is_not_modified(request, etag, review.updated_at):
+        return not_modified_response(etag, review.updated_at)
+
+    return schema_response(ReviewViewSchema, review,
+                           headers=cache_headers(etag, review.updated_at))
 
 # creating a book review
 @review_router.post(
@@ -62,7 +93,7 @@ async def add_book_review(
         session: AsyncSession = Depends(get_session)
 ) -> ReviewViewSchema:
     review = await review_service.add_review_to_book(
-        user_email=current_user.email,
+        user_uid=current_user.uid,
         book_uid=book_uid,
         review_data=review_data,
         session=session
@@ -73,7 +104,7 @@ async def add_book_review(
 @review_router.delete(
     '/{review_id}',
     status_code=status.HTTP_204_NO_CONTENT,
-    dependencies=[user_role_checker],
+    dependencies=[Depends(user_role_checker)],
 )
 async def delete_review(
         review_id: str,
@@ -82,7 +113,7 @@ async def delete_review(
 ) -> None:
     await review_service.delete_review_from_book(
         review_id=review_id,
-        user_email=current_user.email,
+        user_uid=current_user.uid,
         session=session
     )
 
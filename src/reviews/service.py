@@ -1,71 +1,77 @@
 from src.db.models import Review
-from src.auth.service import UserService
-from src.books.service import BookService
+from src.db.loader import load_one, parse_uuid
+from src.books.cache import book_cache
+from src.books.ratings import rating_update
+from src.books.leaderboard import leaderboard
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.reviews.schemas import ReviewCreateSchema, ReviewViewSchema
 from fastapi.exceptions import HTTPException
 from fastapi import status
 from src.errors import UserNotFound, BookNotFound
 from sqlmodel import select, desc
+from sqlalchemy import insert, delete, literal
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
 from typing import List
-
-# create a service to manage books and users
-user_service = UserService()
-book_service = BookService()
+import uuid
 
 
 class ReviewService:
 
     async def add_review_to_book(
             self,
-            user_email: str,
+            user_uid: str,
             book_uid: str,
             review_data: ReviewCreateSchema,
             session: AsyncSession,
-    ) -> dict:
-        try:
-            book = await book_service.get_book(
-                book_uid=book_uid,
-                session=session
-            )
-
-            if not book:
-                raise BookNotFound()
-
-            user = await user_service.get_user_by_email(
-                email=user_email,
-                session=session
+    ) -> Review:
+        book_uid = parse_uuid(book_uid)
+
+        if book_uid is None:
+            raise BookNotFound()
+
+        # a single INSERT ... SELECT fed by the UPDATE of the book's rating
+        # aggregates, when there is no book to update nothing is inserted
+        book = rating_update(book_uid, review_data.rating, 1).cte('book')
+        now = datetime.now()
+        statement = insert(Review).from_select(
+            ['uid', 'rating', 'review_text', 'user_uid', 'book_uid',
+             'created_at', 'updated_at'],
+            select(
+                literal(uuid.uuid4(), Review.uid.type),
+                literal(review_data.rating, Review.rating.type),
+                literal(review_data.review_text, Review.review_text.type),
+                literal(user_uid, Review.user_uid.type),
+                book.c.uid,
+                literal(now, Review.created_at.type),
+                literal(now, Review.updated_at.type)
             )
+        ).returning(Review)
 
-            if not user:
-                raise UserNotFound()
-
-            review_dict = review_data.model_dump()
-            review = Review(
-                **review_dict
-            )
+        try:
+            result = await session.execute(statement)
+            review = result.scalars().first()
+        except IntegrityError:
+            # the user_uid foreign key, the user was deleted meanwhile
+            await session.rollback()
+            raise UserNotFound()
 
-            review.user = user
-            review.book = book
+        if not review:
+            raise BookNotFound()
 
-            session.add(review)
-            await session.commit()
+        await session.commit()
+        await book_cache.invalidate(book_uid)
+        await leaderboard.record_review(
+            book_uid, review.rating, review.created_at, 1)
 
-            return review
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to add review to book: {str(e)}"
-            )
+        return review
 
     async def get_review(
             self,
-            review_id: int,
+            review_id: str,
             session: AsyncSession
     ) -> ReviewViewSchema:
-        statement = select(Review).order_by(desc(Review.created_at))
-        reviews = await session.exec(statement)
-        return reviews.first()
+        return await load_one(session, Review, Review.uid, review_id)
 
     async def get_all_reviews(
             self,
@@ -78,19 +84,33 @@ class ReviewService:
     async def delete_review_from_book(
             self,
             review_id: str,
-            user_email: str,
+            user_uid: str,
             session: AsyncSession
     ) -> None:
-        user = await user_service.get_user_by_email(user_email, session)
-
-        review = self.get_review(review_id, session)
-
-        if not review or review.user != user:
+        # the owner check is part of the DELETE, no row means the review
+        # does not exist or belongs to someone else
+        result = await session.execute(
+            delete(Review).where(
+                Review.uid == parse_uuid(review_id),
+                Review.user_uid == user_uid
+            ).returning(Review.book_uid, Review.rating, Review.created_at),
+            execution_options={'synchronize_session': False}
+        )
+        deleted = result.first()
+
+        if not deleted:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Review not found or not owned by user"
             )
 
-        await session.delete(review)
+        book_uid, rating, created_at = deleted
+
+        if book_uid is not None:
+            await session.execute(rating_update(book_uid, rating, -1))
+
         await session.commit()
 
+        if book_uid is not None:
+            await book_cache.invalidate(book_uid)
+            await leaderboard.record_review(book_uid, rating, created_at, -1)
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, Response, status
+from src.auth.cache import principal_cache
+from src.auth.dependencies import RoleChecker, verified_token_cache
+from src.db.redis import blocklist_filter, blocklist_breaker
+from src.auth.utils import password_hasher
+from src.db.main import get_pool_stats
+from src.books.cache import book_cache
+from src.access_log import access_log
+from src.metrics import collect_metrics, CONTENT_TYPE
+
+# create the routers, metrics are scraped from the root of the app
+stats_router = APIRouter()
+metrics_router = APIRouter()
+
+# operational stats are only visible to admins
+admin_role_checker = RoleChecker(['admin'])
+
+
+# get the hit/miss counters of the in-process caches
+@stats_router.get('/cache',
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(admin_role_checker)])
+async def get_cache_stats() -> dict:
+    return {
+        'principal': principal_cache.stats(),
+        'verified_tokens': verified_token_cache.stats(),
+        'books': book_cache.stats()
+    }
+
+
+# get the state of the token blocklist filter and its circuit breaker
+@stats_router.get('/blocklist',
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(admin_role_checker)])
+async def get_blocklist_stats() -> dict:
+    return {
+        'filter': blocklist_filter.stats(),
+        'breaker': blocklist_breaker.stats()
+    }
+
+
+# get the queue depth and wait times of the password hashing pool
+@stats_router.get('/hashing',
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(admin_role_checker)])
+async def get_hashing_stats() -> dict:
+    return password_hasher.stats()
+
+
+# get the live state of the database connection pool
+@stats_router.get('/db',
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(admin_role_checker)])
+async def get_db_stats() -> dict:
+    return get_pool_stats()
+
+
+# get the queue depth and drops of the access log
+@stats_router.get('/access-log',
+                  status_code=status.HTTP_200_OK,
+                  dependencies=[Depends(admin_role_checker)])
+async def get_access_log_stats() -> dict:
+    return access_log.stats()
+
+
+# get every metric of every worker in the prometheus text format
+@metrics_router.get('/metrics', include_in_schema=False)
+async def get_metrics() -> Response:
+    return Response(content=await collect_metrics(), media_type=CONTENT_TYPE)
@@ -0,0 +1,159 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from src.config import Config
+
+TIMING_PHASES = ('db', 'redis', 'auth', 'serialize')
+
+# placeholders of every paramstyle, and the lists expanded from IN (...),
+# whose placeholders asyncpg renders with a cast like ?::UUID
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|\?|'(?:[^']|'')*'|\b\d+\b")
+_PARAMETER_LIST = re.compile(
+    r'\?((?:::\w+(?: WITH(?:OUT)? TIME ZONE)?(?:\(\?\))?(?:\[\])?)?)'
+    r'(?:\s*,\s*\?\1)+')
+
+
+class RequestTiming:
+    """
+    Time spent per phase and the statements run while serving one request.
+
+    Phases do not overlap: a timed block only keeps the time that no other
+    phase recorded within it, so auth excludes the redis calls it makes.
+
+    A timing started within another one, like a request served inside
+    assert_max_queries, also counts its queries towards the outer one.
+    """
+
+    def __init__(self, path: str = '', parent: Optional['RequestTiming'] = None) -> None:
+        self.path = path
+        self.parent = parent
+        self.started_at = time.perf_counter()
+        self.phases = dict.fromkeys(TIMING_PHASES, 0.0)
+        self.queries = 0
+        self.statements = Counter()
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def record_query(self, statement: str) -> None:
+        shape = statement_shape(statement)
+        timing = self
+
+        while timing is not None:
+            timing.queries += 1
+            timing.statements[shape] += 1
+            timing = timing.parent
+
+        # warned once per statement, when it crosses the threshold
+        if self.statements[shape] == Config.REPEATED_QUERY_THRESHOLD + 1:
+            logging.warning(
+                f"Repeated query, {self.path or 'a task'} ran the same "
+                f"statement more than {Config.REPEATED_QUERY_THRESHOLD} times, "
+                f"likely an N+1: {shape[:200]}")
+
+    def server_timing(self) -> str:
+        total = time.perf_counter() - self.started_at
+        metrics = [
+            f'{phase};dur={seconds * 1000:.1f}'
+            + (f';desc="{self.queries} queries"' if phase == 'db' else '')
+            for phase, seconds in self.phases.items()
+        ]
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+_current_timing: ContextVar[Optional[RequestTiming]] = ContextVar(
+    'request_timing', default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current_timing.get()
+
+
+@contextmanager
+def request_timing(path: str = '') -> Iterator[RequestTiming]:
+    timing = RequestTiming(path, parent=_current_timing.get())
+    token = _current_timing.set(timing)
+
+    try:
+        yield timing
+    finally:
+        _current_timing.reset(token)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    timing = _current_timing.get()
+
+    if timing is None:
+        yield
+        return
+
+    started_at = time.perf_counter()
+    recorded_before = sum(timing.phases.values())
+    try:
+        yield
+    finally:
+        # time the block spent in other phases is counted there only
+        nested = sum(timing.phases.values()) - recorded_before
+        timing.add(phase, max(0.0, time.perf_counter() - started_at - nested))
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    # the same query with other values, or another number of them in an
+    # IN list, has the same shape
+    shape = _PARAMETER.sub('?', ' '.join(statement.split()))
+    return _PARAMETER_LIST.sub(r'?\1', shape)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int) -> Iterator[RequestTiming]:
+    """
+    Fail when the block runs more than `max_queries` statements.
+
+    Requests count when they are served in the same task, as with
+    httpx.ASGITransport:
+
+        async with AsyncClient(transport=ASGITransport(app=app)) as client:
+            with assert_max_queries(3):
+                await client.get('/api/v1/books/...')
+    """
+    with request_timing() as timing:
+        yield timing
+
+    if timing.queries > max_queries:
+        statements = '\n'.join(
+            f'  {count} x {shape}' for shape, count in timing.statements.most_common())
+        raise AssertionError(
+            f'Expected at most {max_queries} queries, ran {timing.queries}:\n{statements}')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    timing = _current_timing.get()
+
+    if timing is not None:
+        timing.record_query(statement)
+        context._timing_started_at = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    timing = _current_timing.get()
+    started_at = getattr(context, '_timing_started_at', None)
+
+    if timing is not None and started_at is not None:
+        timing.add('db', time.perf_counter() - started_at)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    # the sync engine runs in a greenlet that shares the context of the
+    # awaiting task, so the hooks see the timing of the current request
+    event.listen(engine.sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _after_cursor_execute)
@@ -0,0 +1,11 @@
+import os
+
+# src.config needs these, the tests never connect to postgres or redis
+for name, value in (('DATABASE_URL', 'postgresql+asyncpg://test@localhost/test'),
+                    ('JWT_SECRET_KEY', 'test'),
+                    ('JWT_ALGORITHM', 'HS256'),
+                    ('REDIS_URL', 'redis://localhost'),
+                    ('BOOK_CACHE_ENABLED', 'false'),
+                    ('ACCESS_LOG_ENABLED', 'false'),
+                    ('SERVER_TIMING_ENABLED', 'true')):
+    os.environ.setdefault(name, value)
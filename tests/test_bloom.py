@@ -0,0 +1,34 @@
+from src.db.bloom import BloomFilter
+
+
+def test_no_false_negatives_after_add():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f'jti-{index}' for index in range(1000)]
+
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    assert bloom.count == 1000
+
+
+def test_false_positive_rate_stays_near_error_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+    for index in range(1000):
+        bloom.add(f'jti-{index}')
+
+    false_positives = sum(f'other-{index}' in bloom for index in range(10000))
+    assert false_positives / 10000 < 0.03
+
+
+def test_sizing_follows_capacity_and_error_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+    # about 9.6 bits and 7 probes per item for a 1% error rate
+    assert 9500 <= bloom.size <= 9600
+    assert bloom.hash_count == 7
+
+
+def test_empty_filter_contains_nothing():
+    assert 'jti' not in BloomFilter(capacity=10, error_rate=0.01)
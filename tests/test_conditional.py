@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from fastapi import Request
+from src.conditional import cache_headers, is_not_modified, make_etag
+
+LAST_MODIFIED = datetime(2026, 1, 2, 3, 4, 5, 600000, tzinfo=timezone.utc)
+
+
+def request_with(**headers) -> Request:
+    return Request({
+        'type': 'http',
+        'method': 'GET',
+        'path': '/',
+        'headers': [(name.replace('_', '-').encode(), value.encode())
+                    for name, value in headers.items()]
+    })
+
+
+def test_etag_is_weak_and_changes_with_its_parts():
+    etag = make_etag('book', 1)
+
+    assert etag.startswith('W/"')
+    assert etag == make_etag('book', 1)
+    assert etag != make_etag('book', 2)
+
+
+def test_matching_weak_etag():
+    etag = make_etag('book', 1)
+    assert is_not_modified(request_with(if_none_match=etag), etag, LAST_MODIFIED)
+
+
+def test_strong_form_of_the_etag_matches_weakly():
+    etag = make_etag('book', 1)
+    strong = etag.removeprefix('W/')
+
+    assert is_not_modified(request_with(if_none_match=strong), etag, LAST_MODIFIED)
+
+
+def test_etag_in_a_list():
+    etag = make_etag('book', 1)
+    header = f'"other", {etag}'
+
+    assert is_not_modified(request_with(if_none_match=header), etag, LAST_MODIFIED)
+
+
+def test_other_etag_is_modified():
+    etag = make_etag('book', 1)
+    other = make_etag('book', 2)
+
+    assert not is_not_modified(request_with(if_none_match=other), etag, LAST_MODIFIED)
+
+
+def test_wildcard_matches_any_etag():
+    assert is_not_modified(request_with(if_none_match='*'), make_etag('book'), None)
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    request = request_with(
+        if_none_match=make_etag('other'),
+        if_modified_since=format_datetime(LAST_MODIFIED, usegmt=True))
+
+    assert not is_not_modified(request, make_etag('book'), LAST_MODIFIED)
+
+
+def test_if_modified_since_compares_whole_seconds():
+    since = format_datetime(LAST_MODIFIED, usegmt=True)
+    etag = make_etag('book')
+
+    assert is_not_modified(request_with(if_modified_since=since), etag, LAST_MODIFIED)
+    assert not is_not_modified(
+        request_with(if_modified_since='Thu, 01 Jan 2026 00:00:00 GMT'),
+        etag, LAST_MODIFIED)
+
+
+def test_malformed_if_modified_since_is_modified():
+    request = request_with(if_modified_since='yesterday')
+    assert not is_not_modified(request, make_etag('book'), LAST_MODIFIED)
+
+
+def test_without_conditions_is_modified():
+    assert not is_not_modified(request_with(), make_etag('book'), LAST_MODIFIED)
+
+
+def test_cache_headers():
+    headers = cache_headers(make_etag('book'), LAST_MODIFIED)
+
+    assert headers['Last-Modified'] == 'Fri, 02 Jan 2026 03:04:05 GMT'
+    assert headers['Cache-Control'] == 'private, no-cache'
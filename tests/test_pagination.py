@@ -0,0 +1,31 @@
+import uuid
+from datetime import datetime, timezone
+import pytest
+from src.db.pagination import decode_cursor, encode_cursor
+from src.errors import InvalidCursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 1, 2, 3, 4, 5, 678, tzinfo=timezone.utc)
+    uid = uuid.uuid4()
+
+    cursor = encode_cursor([created_at, uid])
+
+    assert '=' not in cursor
+    assert decode_cursor(cursor, 2) == [created_at.isoformat(), str(uid)]
+
+
+def test_cursor_keeps_plain_values():
+    assert decode_cursor(encode_cursor([0.5, 'abc']), 2) == [0.5, 'abc']
+
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    encode_cursor(['only one value']),
+    encode_cursor(['a', 'b', 'c']),
+    'eyJub3QiOiJhIGxpc3QifQ',
+    ''
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, 2)
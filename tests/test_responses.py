@@ -0,0 +1,49 @@
+from typing import Dict, List, Optional, Union
+from pydantic import BaseModel, Field
+from src.responses import dump
+
+
+class Author:
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.password_hash = 'secret'
+
+
+class Book:
+
+    def __init__(self, title: str, authors: list, editor=None, by_role=None) -> None:
+        self.title = title
+        self.authors = authors
+        self.editor = editor
+        self.by_role = by_role or {}
+
+
+class AuthorSchema(BaseModel):
+    name: str = Field(serialization_alias='authorName')
+
+
+class BookSchema(BaseModel):
+    title: str
+    authors: Optional[List[AuthorSchema]]
+    editor: Union[AuthorSchema, None] = None
+    by_role: Dict[str, AuthorSchema] = {}
+
+
+def test_dump_matches_model_dump():
+    book = Book('Dune', [Author('Frank')], Author('Sterling'), {'lead': Author('Frank')})
+    expected = BookSchema.model_validate(book, from_attributes=True).model_dump(by_alias=True)
+
+    assert dump(BookSchema, book) == expected
+
+
+def test_dump_optional_fields_left_empty():
+    assert dump(BookSchema, Book('Dune', None)) == {
+        'title': 'Dune', 'authors': None, 'editor': None, 'by_role': {}}
+
+
+def test_dump_never_copies_orm_objects():
+    data = dump(BookSchema, Book('Dune', [Author('Frank')], Author('Sterling')))
+
+    assert data['authors'] == [{'authorName': 'Frank'}]
+    assert data['editor'] == {'authorName': 'Sterling'}
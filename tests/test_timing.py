@@ -0,0 +1,120 @@
+import time
+import uuid
+from datetime import date, datetime, timezone
+import httpx
+import pytest
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.compiler import compiles
+from sqlmodel import SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+from src import app
+from src.books import routes as book_routes
+from src.db.main import async_engine, get_read_session
+from src.db.models import Book, Review
+from src.timing import (
+    assert_max_queries,
+    instrument_engine,
+    request_timing,
+    statement_shape,
+    timed
+)
+
+
+@compiles(JSONB, 'sqlite')
+def compile_jsonb_for_sqlite(type_, compiler, **kw):
+    return 'JSON'
+
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+
+def compile_in_list(size: int) -> str:
+    statement = select(Review).where(
+        Review.book_uid.in_([uuid.uuid4() for _ in range(size)]),
+        Review.review_text.in_(['text'] * size))
+    return str(statement.compile(dialect=async_engine.dialect,
+                                 compile_kwargs={'render_postcompile': True}))
+
+
+def test_in_lists_of_any_length_have_one_shape():
+    assert '::UUID' in compile_in_list(2)
+    assert statement_shape(compile_in_list(2)) == statement_shape(compile_in_list(3))
+    assert 'IN (?::UUID)' in statement_shape(compile_in_list(3))
+
+
+def test_phases_do_not_overlap():
+    with request_timing() as timing:
+        with timed('auth'):
+            with timed('redis'):
+                time.sleep(0.02)
+
+    assert timing.phases['redis'] >= 0.02
+    assert timing.phases['auth'] < 0.01
+
+
+@pytest.fixture
+async def client():
+    engine = create_async_engine('sqlite+aiosqlite://')
+    instrument_engine(engine)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+
+    async with AsyncSession(engine) as session:
+        now = datetime.now(timezone.utc)
+        for index in range(3):
+            book = Book(title=f'Book {index}', author='Author', publisher='Publisher',
+                        published_date=date(2020, 1, 1), page_count=100,
+                        language='en', created_at=now, updated_at=now)
+            session.add(book)
+        await session.commit()
+
+    async def get_test_session():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    app.dependency_overrides.update({
+        get_read_session: get_test_session,
+        book_routes.access_token_bearer: lambda: {'user': {'user_uid': str(uuid.uuid4())}},
+        book_routes.role_checker: lambda: True
+    })
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://localhost',
+                                 headers={'Authorization': 'Bearer test'}) as client:
+        yield client
+
+    app.dependency_overrides.clear()
+    await engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_book_list_runs_one_query(client):
+    with assert_max_queries(1):
+        response = await client.get('/api/v1/books', params={'limit': 2})
+
+    assert response.status_code == 200
+    assert len(response.json()['books']) == 2
+    assert 'db;dur=' in response.headers['server-timing']
+
+
+@pytest.mark.anyio
+async def test_next_page_runs_one_query(client):
+    first_page = (await client.get('/api/v1/books', params={'limit': 2})).json()
+
+    with assert_max_queries(1):
+        response = await client.get(
+            '/api/v1/books', params={'limit': 2, 'cursor': first_page['next_cursor']})
+
+    assert response.status_code == 200
+    assert len(response.json()['books']) == 1
+
+
+@pytest.mark.anyio
+async def test_assert_max_queries_fails_over_budget(client):
+    with pytest.raises(AssertionError, match='at most 0 queries'):
+        with assert_max_queries(0):
+            await client.get('/api/v1/books')